@@ -0,0 +1,100 @@
+"""
+Concurrency benchmark for FrozenTranscriptMapper
+
+Builds a set of synthetic transcripts, freezes them into a single
+snapshot and translates the same batches of queries with 1..N threads
+sharing that snapshot. Reports wall time, throughput and the speedup
+over a single thread.
+
+Usage:
+
+    python benchmarks/bench_snapshot_concurrency.py --threads 8
+"""
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from nvta.transcript_utils import Transcript, TranscriptMapper
+
+
+def random_cigar(rng, numOps):
+    ops = []
+    for i in range(numOps):
+        ops.append("{}M".format(rng.randint(20, 200)))
+        if rng.random() < 0.2:
+            ops.append("{}I".format(rng.randint(1, 5)))
+        else:
+            ops.append("{}{}".format(rng.randint(1, 5000), rng.choice("ND")))
+    ops.append("{}M".format(rng.randint(20, 200)))
+    return "".join(ops)
+
+
+def build_mapper(numTranscripts, numOps, seed):
+    rng = random.Random(seed)
+    mapper = TranscriptMapper()
+    for i in range(numTranscripts):
+        name = "TR{}".format(i)
+        mapper.transcripts[name] = Transcript(
+            name=name,
+            chrom="CHR{}".format(rng.randint(1, 22)),
+            startPos=rng.randint(0, 10 ** 8),
+            cigar=random_cigar(rng, numOps),
+            direction=rng.choice("+-"))
+    return mapper
+
+
+def build_batches(frozenMapper, numBatches, batchSize, seed):
+    rng = np.random.default_rng(seed)
+    transcripts = list(frozenMapper.get_transcripts().values())
+    ends = np.array([x.transcriptEnd for x in transcripts])
+    names = np.array([x.name for x in transcripts])
+
+    batches = []
+    for i in range(numBatches):
+        index = rng.integers(0, len(transcripts), batchSize)
+        positions = (rng.random(batchSize) * (ends[index] + 1)).astype(int)
+        batches.append((names[index], positions))
+    return batches
+
+
+def run(frozenMapper, batches, numThreads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=numThreads) as executor:
+        list(executor.map(lambda x: frozenMapper.translate_batch(*x),
+                          batches))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--transcripts", type=int, default=200)
+    parser.add_argument("--ops", type=int, default=20)
+    parser.add_argument("--batches", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=200000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    frozenMapper = build_mapper(args.transcripts, args.ops, args.seed).freeze()
+    batches = build_batches(frozenMapper, args.batches, args.batch_size,
+                            args.seed)
+    numQueries = args.batches * args.batch_size
+
+    # warm up
+    run(frozenMapper, batches[:2], 1)
+
+    baseline = None
+    print("threads      seconds       queries/s   speedup")
+    for numThreads in range(1, args.threads + 1):
+        elapsed = run(frozenMapper, batches, numThreads)
+        if baseline is None:
+            baseline = elapsed
+        print("{:>7d} {:12.4f} {:15.1f} {:9.2f}".format(
+            numThreads, elapsed, numQueries / elapsed, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Translation backends for Transcript.translate_coordinates
+
+A backend looks up the adjustment value of the interval containing a
+transcript position. Three implementations are available:
+
+- tree   : IntervalTree lookup, the original implementation. Fine for
+           transcripts made of a few long CIGAR operations.
+- sorted : binary search over the sorted interval starts. Scales well
+           with many short CIGAR operations.
+- dense  : table with the adjustment of every transcript position.
+           Constant time lookups for heavily queried transcripts, at the
+           cost of memory proportional to the transcript length.
+
+select_backend picks one per transcript from its number of segments,
+its length and an optional hint of how often it will be queried.
+"""
+import logging
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+# transcripts with up to this many segments use the IntervalTree
+TREE_MAX_SEGMENTS = 16
+# dense tables are only built for transcripts up to this length
+DENSE_MAX_LENGTH = 100000
+# expected queries per transcript base needed to build a dense table
+DENSE_MIN_QUERIES_PER_BASE = 1.0
+
+
+def get_segments(transcript):
+    """
+    Get the intervals of a transcript as sorted arrays
+
+    :param transcript: Transcript object
+    :return: tuple of arrays with the start, end and adjustment value
+             of every interval, sorted by start. Bulk built transcripts
+             return their compiled segments without copying.
+    :rtype: tuple
+    """
+    if transcript.segments is not None:
+        return transcript.segments
+
+    # imported here to keep numpy out of the import of transcript_utils
+    import numpy as np
+
+    intervals = sorted(transcript.conversionTree)
+    return (np.array([x.begin for x in intervals], dtype=np.int64),
+            np.array([x.end for x in intervals], dtype=np.int64),
+            np.array([x.data for x in intervals], dtype=np.float64))
+
+
+class TranslationBackend(ABC):
+    """
+    Base class of translation backends
+
+    Subclasses set name and implement lookup, which returns the
+    adjustment value for a position that is within the transcript.
+    """
+
+    name = None
+
+    @abstractmethod
+    def __init__(self, transcript):
+        """
+        Initiate the backend for a single transcript
+
+        :param transcript: Transcript object
+        :return: none
+        """
+
+    @abstractmethod
+    def lookup(self, inputPosition):
+        """
+        Look up the adjustment value of a transcript position
+
+        :param inputPosition: int specifying a valid transcript coordinate
+        :return: adjustment value of the interval containing the position
+        :rtype: int or float
+        """
+
+
+class TreeBackend(TranslationBackend):
+    """
+    Lookup in the IntervalTree of the transcript
+    """
+
+    name = "tree"
+
+    def __init__(self, transcript):
+        self.conversionTree = transcript.conversionTree
+
+    def lookup(self, inputPosition):
+        intervalSet = self.conversionTree[inputPosition]
+        if len(intervalSet) > 1:
+            logger.error("Overlapping intervals detected!")
+            raise Exception("Error in interval tree")
+
+        elif len(intervalSet) == 0:
+            logger.error("No interval for position detected!")
+            raise Exception("Error in interval tree")
+
+        return next(iter(intervalSet)).data
+
+
+class SortedArrayBackend(TranslationBackend):
+    """
+    Binary search over the sorted interval starts
+    """
+
+    name = "sorted"
+
+    def __init__(self, transcript):
+        self.segStarts, segEnds, self.segAdjustments = \
+            get_segments(transcript)
+
+    def lookup(self, inputPosition):
+        return self.segAdjustments[self.segStarts.searchsorted(
+            inputPosition, side='right') - 1]
+
+
+class DenseTableBackend(TranslationBackend):
+    """
+    Table with the adjustment value of every transcript position
+    """
+
+    name = "dense"
+
+    def __init__(self, transcript):
+        segStarts, segEnds, segAdjustments = get_segments(transcript)
+        self.table = segAdjustments.repeat(segEnds - segStarts)
+
+    def lookup(self, inputPosition):
+        return self.table[inputPosition]
+
+
+BACKENDS = {backend.name: backend for backend in [TreeBackend,
+                                                  SortedArrayBackend,
+                                                  DenseTableBackend]}
+
+
+def select_backend(numSegments, transcriptLength, queryFrequency=None,
+                   hasTree=True):
+    """
+    Pick a backend name for a transcript
+
+    :param numSegments: int number of intervals of the transcript
+                        (one per match operation and per inserted base)
+    :param transcriptLength: int number of bases of the transcript
+    :param queryFrequency: optional int or float of the expected number
+                           of queries for the transcript
+    :param hasTree: bool whether the IntervalTree of the transcript is
+                    built already. Bulk built transcripts do not have one,
+                    and building it would cost more than it saves.
+    :return: name of the backend
+    :rtype: string
+    """
+    if queryFrequency is not None and \
+            transcriptLength <= DENSE_MAX_LENGTH and \
+            queryFrequency >= transcriptLength * DENSE_MIN_QUERIES_PER_BASE:
+        return DenseTableBackend.name
+
+    if hasTree and numSegments <= TREE_MAX_SEGMENTS:
+        return TreeBackend.name
+
+    return SortedArrayBackend.name
+
+
+def create_backend(transcript, backendName):
+    """
+    Create a backend by name
+
+    :param transcript: Transcript object
+    :param backendName: string with one of the names in BACKENDS
+    :return: backend for the transcript
+    :rtype: TranslationBackend
+    """
+    if backendName not in BACKENDS:
+        raise ValueError("Unknown backend {}, use one of {}".format(
+            backendName, ", ".join(sorted(BACKENDS))))
+    return BACKENDS[backendName](transcript)
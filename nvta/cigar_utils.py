@@ -0,0 +1,240 @@
+"""
+Vectorized CIGAR processing for bulk transcript construction
+
+Transcript.process_cigar walks every CIGAR operation of a single
+transcript in Python. The functions here process all transcripts at once:
+
+- tokenize_cigars parses all CIGAR strings from one concatenated byte
+  buffer into operation lengths and codes (CSR layout, one offset array
+  pointing to the first operation of every transcript)
+- compile_transcripts turns the operations into the same segments the
+  IntervalTree of Transcript.process_cigar holds, using cumulative sums
+  for transcript and reference offsets and a reordering of the operations
+  of '-' transcripts, and returns them as a SegmentStore
+"""
+import logging
+
+import numpy as np
+
+from nvta.segment_utils import SegmentStore
+
+logger = logging.getLogger(__name__)
+
+# operations supported for coordinate mapping
+MATCH_OPS = b"M=X"
+GAP_OPS = b"DN"
+INSERTION_OPS = b"I"
+# valid in a CIGAR string but not supported by the parser
+UNSUPPORTED_OPS = b"SHP"
+
+POWERS_OF_TEN = np.power(10, np.arange(19), dtype=np.int64)
+
+
+def byte_mask(buffer, chars):
+    mask = np.zeros(len(buffer), dtype=bool)
+    for char in chars:
+        mask |= buffer == char
+    return mask
+
+
+def tokenize_cigars(cigars):
+    """
+    Parse a list of CIGAR strings in a single vectorized pass
+
+    :param cigars: sequence of CIGAR strings
+    :return: tuple of int array of operation lengths, uint8 array of
+             operation characters and int array of length n + 1 with
+             the first operation of each CIGAR
+    :rtype: tuple
+    """
+    cigars = [str(x) for x in cigars]
+    cigarLengths = np.fromiter((len(x) for x in cigars), dtype=np.int64,
+                               count=len(cigars))
+    if np.any(cigarLengths == 0):
+        logger.error("Empty CIGAR string detected")
+        raise ValueError("Malformatted CIGAR string")
+
+    try:
+        buffer = np.frombuffer("".join(cigars).encode('ascii'),
+                               dtype=np.uint8)
+    except UnicodeEncodeError:
+        logger.error("Non ASCII character in CIGAR string detected")
+        raise ValueError("Invalid CIGAR string character")
+
+    isDigit = (buffer >= ord('0')) & (buffer <= ord('9'))
+    opPositions = np.flatnonzero(~isDigit)
+    opCodes = buffer[opPositions]
+
+    invalid = opCodes[~byte_mask(opCodes,
+                                 MATCH_OPS + GAP_OPS + INSERTION_OPS)]
+    if len(invalid):
+        unknown = invalid[~byte_mask(invalid, UNSUPPORTED_OPS)]
+        if len(unknown):
+            logger.error(("Invalid CIGAR string character detected "
+                          "{}".format(chr(unknown[0]))))
+            raise ValueError("Invalid CIGAR string character")
+        logger.error(("CIGAR parser does not support logic "
+                      "for {}".format(chr(invalid[0]))))
+        raise ValueError("Unsupported CIGAR character")
+
+    cigarEnds = np.cumsum(cigarLengths)
+    cigarStarts = cigarEnds - cigarLengths
+
+    # every CIGAR ends in an operation and every operation
+    # has at least one digit in front of it
+    previous = opPositions - 1
+    if np.any(isDigit[cigarEnds - 1]) or np.any(previous < 0) or \
+            np.any(~isDigit[previous]) or \
+            np.any(np.isin(opPositions, cigarStarts)):
+        logger.error(("Parsed information does not match original CIGAR, "
+                      "potentially malformatted CIGAR string."))
+        raise ValueError("Malformatted CIGAR string")
+
+    # value of each digit, scaled by its distance to the operation
+    digitPositions = np.flatnonzero(isDigit)
+    digitOps = np.searchsorted(opPositions, digitPositions)
+    exponents = opPositions[digitOps] - digitPositions - 1
+    if np.any(exponents >= len(POWERS_OF_TEN)):
+        raise ValueError("CIGAR operation length too large")
+    digitValues = ((buffer[digitPositions] - ord('0')).astype(np.int64) *
+                   POWERS_OF_TEN[exponents])
+    firstDigits = np.searchsorted(digitOps, np.arange(len(opPositions)))
+    opLengths = np.add.reduceat(digitValues, firstDigits) \
+        if len(opPositions) else np.zeros(0, dtype=np.int64)
+
+    opOffsets = np.concatenate(
+        ([0], np.searchsorted(opPositions, cigarEnds)))
+
+    return opLengths, opCodes, opOffsets
+
+
+def exclusive_cumsum(values, owners, offsets):
+    """
+    Cumulative sum of values restarting at the first operation of
+    every transcript, excluding the current value.
+    """
+    cumulative = np.concatenate(([0], np.cumsum(values)))
+    return cumulative[:-1] - cumulative[offsets[:-1]][owners]
+
+
+def compile_transcripts(names, chroms, starts, cigars, strands):
+    """
+    Compile transcripts into segments without per operation Python loops
+
+    :param names: sequence of transcript names
+    :param chroms: sequence of chromosome names
+    :param starts: sequence of int reference start positions
+    :param cigars: sequence of CIGAR strings
+    :param strands: sequence of '+' or '-' transcript directions
+    :return: store with the segments of all transcripts, identical to the
+             intervals built by Transcript.process_cigar
+    :rtype: SegmentStore
+    """
+    names = np.asarray(names, dtype=np.str_)
+    chroms = np.asarray(chroms, dtype=np.str_)
+    starts = np.asarray(starts, dtype=np.int64)
+    strands = np.asarray(strands, dtype=np.str_)
+    numTranscripts = len(names)
+
+    if not (len(chroms) == len(starts) == len(cigars) == len(strands) ==
+            numTranscripts):
+        raise ValueError("All input arrays need to have equal length")
+
+    if not np.all((strands == "+") | (strands == "-")):
+        raise ValueError(("Direction needs to be '+' or '-' "
+                          "indicating the direction of the transcript"))
+
+    opLengths, opCodes, opOffsets = tokenize_cigars(cigars)
+    numOps = np.diff(opOffsets)
+    signs = np.where(strands == "-", -1, 1).astype(np.int64)
+
+    # '-' transcripts are processed from the last operation to the first
+    owners = np.repeat(np.arange(numTranscripts), numOps)
+    order = np.arange(len(opLengths))
+    reverse = signs[owners] < 0
+    order[reverse] = (opOffsets[owners] + opOffsets[owners + 1] - 1 -
+                      order)[reverse]
+    opLengths = opLengths[order]
+    opCodes = opCodes[order]
+    opSigns = signs[owners]
+
+    isMatch = byte_mask(opCodes, MATCH_OPS)
+    isGap = byte_mask(opCodes, GAP_OPS)
+    isInsertion = byte_mask(opCodes, INSERTION_OPS)
+
+    # transcript and reference offsets in front of every operation
+    transcriptLengths = np.where(isMatch | isInsertion, opLengths, 0)
+    refShifts = np.where(isGap, opLengths,
+                         np.where(isInsertion, -opLengths, 0)) * opSigns
+    tStarts = exclusive_cumsum(transcriptLengths, owners, opOffsets)
+    refTransforms = (starts[owners] +
+                     exclusive_cumsum(refShifts, owners, opOffsets))
+
+    # one segment per match operation and per inserted base
+    segCounts = np.where(isInsertion, opLengths,
+                         np.where(isMatch & (opLengths > 0), 1, 0))
+    segOps = np.repeat(np.arange(len(opLengths)), segCounts)
+    segCumulative = np.concatenate(([0], np.cumsum(segCounts)))
+    segOffsets = segCumulative[opOffsets]
+
+    if np.any(np.diff(segOffsets) == 0):
+        empty = names[np.flatnonzero(np.diff(segOffsets) == 0)[0]]
+        logger.error("Transcript {} has no aligned bases".format(empty))
+        raise ValueError("CIGAR string without aligned bases")
+
+    baseIndex = np.arange(len(segOps)) - segCumulative[segOps]
+    segIsInsertion = isInsertion[segOps]
+
+    segStarts = tStarts[segOps] + baseIndex
+    segEnds = np.where(segIsInsertion, segStarts + 1,
+                       segStarts + opLengths[segOps])
+
+    # inserted base i is written as <ref base before insertion>.<i + 1>
+    insertionNumber = baseIndex + 1
+    anchors = refTransforms[segOps] - opSigns[segOps] * insertionNumber
+    digits = np.searchsorted(POWERS_OF_TEN, insertionNumber, side='right')
+    scale = POWERS_OF_TEN[digits].astype(np.float64)
+    fractions = np.where(anchors < 0, -insertionNumber, insertionNumber)
+    insertionAdjustments = (anchors * scale + fractions) / scale
+
+    segAdjustments = np.where(segIsInsertion, insertionAdjustments,
+                              refTransforms[segOps].astype(np.float64))
+
+    chromNames, chromIds = np.unique(chroms, return_inverse=True)
+
+    return SegmentStore(names=names,
+                        chromNames=chromNames,
+                        chromIds=chromIds,
+                        strands=signs,
+                        startPositions=starts,
+                        cigars=cigars,
+                        offsets=segOffsets,
+                        segStarts=segStarts,
+                        segEnds=segEnds,
+                        segAdjustments=segAdjustments)
+
+
+def reference_spans(starts, cigars, strands):
+    """
+    Compute the reference region covered by each transcript
+
+    :param starts: sequence of int reference start positions
+    :param cigars: sequence of CIGAR strings
+    :param strands: sequence of '+' or '-' transcript directions
+    :return: tuple of int arrays with the leftmost reference position
+             and the position after the rightmost aligned reference base
+    :rtype: tuple
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    isReverse = np.asarray(strands, dtype=np.str_) == "-"
+
+    opLengths, opCodes, opOffsets = tokenize_cigars(cigars)
+    consumesRef = byte_mask(opCodes, MATCH_OPS + GAP_OPS)
+    cumulative = np.concatenate(
+        ([0], np.cumsum(np.where(consumesRef, opLengths, 0))))
+    refLengths = cumulative[opOffsets[1:]] - cumulative[opOffsets[:-1]]
+
+    # CIGAR strings are in reference direction, '-' transcripts start
+    # at the reference end of their alignment
+    lefts = np.where(isReverse, starts - refLengths + 1, starts)
+    return lefts, lefts + refLengths
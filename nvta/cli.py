@@ -0,0 +1,435 @@
+"""
+Command line interface for nvta
+
+Subcommands:
+
+- index     : process a transcript file once and save it as an index
+- translate : stream a query file and translate transcript coordinates
+- reverse   : stream reference positions and map them back to transcripts
+
+Heavy imports (intervaltree, multiprocessing) are deferred to the point
+where they are needed so that short invocations start quickly.
+"""
+import sys
+import time
+import logging
+import argparse
+
+QUERY_RESULT_FORMAT = "{name}\t{inputPos}\t{chrom}\t{refPos}\t{direction}\n"
+REVERSE_RESULT_FORMAT = ("{chrom}\t{refPos}\t{name}\t"
+                         "{transcriptPos}\t{direction}\n")
+
+# mapper shared by worker processes, set up by _init_worker
+_workerMapper = None
+
+
+class PhaseStats():
+    """
+    Collects wall clock timings and record counts of the CLI phases
+    and reports them when --stats is given.
+    """
+
+    def __init__(self):
+        self.phases = []
+        self._start = None
+        self._startTotal = time.perf_counter()
+
+    def start(self):
+        self._start = time.perf_counter()
+
+    def stop(self, phase, count=None):
+        self.phases.append((phase, time.perf_counter() - self._start, count))
+
+    def report(self, stream=None):
+        """
+        Write phase timings and throughput to the given stream
+
+        :param stream: file like object to write the report to
+        :return: none
+        """
+        if stream is None:
+            stream = sys.stderr
+        for phase, elapsed, count in self.phases:
+            line = "[nvta] {:<10} {:10.4f} s".format(phase, elapsed)
+            if count is not None:
+                rate = count / elapsed if elapsed > 0 else float("inf")
+                line += "  {:>10d} records  {:14.1f} records/s".format(count,
+                                                                       rate)
+            stream.write(line + "\n")
+        stream.write("[nvta] {:<10} {:10.4f} s\n".format(
+            "total", time.perf_counter() - self._startTotal))
+
+
+def load_mapper(transcripts=None, index=None, regionFile=None,
+                regions=None):
+    """
+    Load a TranscriptMapper from a transcript file, an index or a
+    region file
+
+    :param transcripts: string containing path to a transcript file
+    :param index: string containing path to an index directory
+    :param regionFile: string containing path to a region file
+    :param regions: list of regions to load from the region file,
+                    all transcripts are loaded without regions
+    :return: TranscriptMapper with imported transcripts
+    :rtype: TranscriptMapper
+    """
+    from nvta.transcript_utils import TranscriptMapper
+
+    mapper = TranscriptMapper()
+    if index is not None:
+        mapper.import_index(index)
+    elif regionFile is not None:
+        if not regions:
+            from nvta.region_utils import read_region_index, get_index_file
+            regions = sorted(read_region_index(get_index_file(regionFile)))
+        mapper.import_transcript_regions(regionFile, regions, bulk=True)
+    else:
+        mapper.import_transcripts(transcripts, bulk=True)
+    return mapper
+
+
+def _init_worker(transcripts, index, regionFile, regions, loaded):
+    global _workerMapper
+    try:
+        _workerMapper = load_mapper(transcripts=transcripts, index=index,
+                                    regionFile=regionFile, regions=regions)
+    except Exception as e:
+        loaded.put(e)
+        raise
+    # tell the parent that loading finished, for the load phase timing
+    loaded.put(len(_workerMapper.get_transcripts()))
+
+
+def _translate_lines(lines, mapper=None):
+    """
+    Translate a chunk of query lines into formatted result lines
+
+    :param lines: list of strings from a query file
+    :param mapper: TranscriptMapper to use, defaults to the worker mapper
+    :return: string containing the formatted results for the chunk
+    :rtype: string
+    """
+    from nvta.transcript_utils import TranscriptMapper
+
+    if mapper is None:
+        mapper = _workerMapper
+
+    output = []
+    for line in lines:
+        if not line.strip():
+            continue
+        lineSplit = TranscriptMapper.check_query_line(line)
+        result = mapper.run_single_query(lineSplit[0], int(lineSplit[1]))
+        output.append(QUERY_RESULT_FORMAT.format(**result))
+    return "".join(output)
+
+
+def _reverse_lines(lines, mapper=None):
+    """
+    Reverse map a chunk of reference position lines into result lines
+
+    :param lines: list of strings from a reverse query file
+    :param mapper: TranscriptMapper to use, defaults to the worker mapper
+    :return: string containing the formatted results for the chunk
+    :rtype: string
+    """
+    from nvta.transcript_utils import TranscriptMapper
+
+    if mapper is None:
+        mapper = _workerMapper
+
+    output = []
+    for line in lines:
+        if not line.strip():
+            continue
+        lineSplit = TranscriptMapper.check_reverse_query_line(line)
+        for result in mapper.run_reverse_query(lineSplit[0],
+                                               int(lineSplit[1])):
+            output.append(REVERSE_RESULT_FORMAT.format(**result))
+    return "".join(output)
+
+
+def _chunk_lines(stream, chunkSize):
+    chunk = []
+    for line in stream:
+        chunk.append(line)
+        if len(chunk) >= chunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _open_input(path):
+    if path == "-":
+        return sys.stdin
+    return open(path, 'r')
+
+
+def _open_output(path):
+    if path is None or path == "-":
+        return sys.stdout
+    return open(path, 'w')
+
+
+def _stream_queries(args, worker, stats):
+    """
+    Shared driver of the translate and reverse subcommands. Lines are
+    read in chunks and either processed in this process or handed to a
+    pool of worker processes, keeping the original order of the input.
+
+    :param args: parsed command line arguments
+    :param worker: function translating a chunk of lines
+    :param stats: PhaseStats collecting timings
+    :return: none
+    """
+    inStream = _open_input(args.queries)
+    outStream = _open_output(args.output)
+    counter = [0]
+
+    def counted_chunks():
+        for lines in _chunk_lines(inStream, args.chunk_size):
+            counter[0] += len(lines)
+            yield lines
+
+    try:
+        if args.jobs > 1:
+            import multiprocessing
+
+            loaded = multiprocessing.Queue()
+            stats.start()
+            pool = multiprocessing.Pool(args.jobs,
+                                        initializer=_init_worker,
+                                        initargs=(args.transcripts,
+                                                  args.index,
+                                                  args.region_file,
+                                                  args.region,
+                                                  loaded))
+            try:
+                # wait for every worker to load its transcripts
+                for i in range(args.jobs):
+                    numTranscripts = loaded.get()
+                    if isinstance(numTranscripts, Exception):
+                        pool.terminate()
+                        raise numTranscripts
+                stats.stop("load", numTranscripts)
+                stats.start()
+                for output in pool.imap(worker, counted_chunks()):
+                    outStream.write(output)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            stats.start()
+            mapper = load_mapper(transcripts=args.transcripts,
+                                 index=args.index,
+                                 regionFile=args.region_file,
+                                 regions=args.region)
+            stats.stop("load", len(mapper.get_transcripts()))
+            stats.start()
+            for lines in counted_chunks():
+                outStream.write(worker(lines, mapper))
+        stats.stop(args.command, counter[0])
+    finally:
+        if inStream is not sys.stdin:
+            inStream.close()
+        if outStream is not sys.stdout:
+            outStream.close()
+
+
+def run_index(args, stats):
+    stats.start()
+    mapper = load_mapper(transcripts=args.transcripts)
+    stats.stop("load", len(mapper.get_transcripts()))
+    stats.start()
+    mapper.export_index(args.output)
+    stats.stop("write")
+
+
+def run_compress(args, stats):
+    from nvta.region_utils import build_region_file
+
+    stats.start()
+    numBlocks = build_region_file(args.transcripts, args.output,
+                                  blockSize=args.block_size * 1024)
+    stats.stop("write", numBlocks)
+
+
+def run_translate(args, stats):
+    if args.out_of_core:
+        _sort_merge_queries(args, stats)
+    else:
+        _stream_queries(args, _translate_lines, stats)
+
+
+def _sort_merge_queries(args, stats):
+    """
+    Translate a query file with bounded memory by sorting it by
+    transcript on disk (see nvta.external_sort_utils)
+
+    :param args: parsed command line arguments
+    :param stats: PhaseStats collecting timings
+    :return: none
+    """
+    if args.queries == "-" or args.output in (None, "-"):
+        raise ValueError("--out-of-core needs a query file and --output")
+
+    stats.start()
+    mapper = load_mapper(transcripts=args.transcripts, index=args.index,
+                         regionFile=args.region_file, regions=args.region)
+    stats.stop("load", len(mapper.get_transcripts()))
+    stats.start()
+    count = mapper.run_queries_out_of_core(
+        args.queries, args.output, spillDir=args.spill_dir,
+        memoryBudget=args.memory_budget * 1024 ** 2, grouped=args.grouped)
+    stats.stop(args.command, count)
+
+
+def run_reverse(args, stats):
+    _stream_queries(args, _reverse_lines, stats)
+
+
+def _add_source_arguments(parser):
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("-t", "--transcripts",
+                        help="transcript file (5 tab separated columns)")
+    source.add_argument("-x", "--index",
+                        help="index directory created with 'nvta index'")
+    source.add_argument("-R", "--region-file",
+                        help="region file created with 'nvta compress'")
+    parser.add_argument("--region", action="append", default=None,
+                        help=("with --region-file, only load transcripts "
+                              "overlapping chrom or chrom:start-end "
+                              "(0-based, end exclusive), can be repeated"))
+
+
+def _add_stream_arguments(parser):
+    parser.add_argument("queries",
+                        help="query file to process, '-' for stdin")
+    parser.add_argument("-o", "--output", default=None,
+                        help="output file, default is stdout")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes (default: 1)")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="number of lines per work unit "
+                             "(default: 10000)")
+
+
+def build_parser():
+    """
+    Build the argument parser of the nvta command
+
+    :return: argument parser with all subcommands
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        prog="nvta",
+        description=("Mapping transcript coordinates to the "
+                     "reference genome based on their CIGAR string"))
+    parser.add_argument("--stats", action="store_true",
+                        help="print phase timings and throughput to stderr")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    indexParser = subparsers.add_parser(
+        "index", help="build an index from a transcript file")
+    indexParser.add_argument("-t", "--transcripts", required=True,
+                             help="transcript file (5 tab separated columns)")
+    indexParser.add_argument("-o", "--output", required=True,
+                             help="index directory to write")
+    indexParser.set_defaults(func=run_index)
+
+    compressParser = subparsers.add_parser(
+        "compress",
+        help=("sort and block compress a transcript file with a region "
+              "index for loading single regions"))
+    compressParser.add_argument("-t", "--transcripts", required=True,
+                                help=("transcript file (5 tab separated "
+                                      "columns)"))
+    compressParser.add_argument("-o", "--output", required=True,
+                                help=("region file to write, the index is "
+                                      "written next to it (.nvi)"))
+    compressParser.add_argument("--block-size", type=int, default=64,
+                                help=("uncompressed size of a block in KB "
+                                      "(default: 64)"))
+    compressParser.set_defaults(func=run_compress)
+
+    translateParser = subparsers.add_parser(
+        "translate",
+        help="translate transcript positions to reference positions")
+    _add_source_arguments(translateParser)
+    _add_stream_arguments(translateParser)
+    translateParser.add_argument(
+        "--out-of-core", action="store_true",
+        help=("sort the queries by transcript on disk, for query files "
+              "larger than memory (needs --output, runs in a single process)"))
+    translateParser.add_argument(
+        "--spill-dir", default=None,
+        help="directory for temporary files of --out-of-core")
+    translateParser.add_argument(
+        "--memory-budget", type=int, default=256,
+        help="memory budget of --out-of-core runs in MB (default: 256)")
+    translateParser.add_argument(
+        "--grouped", action="store_true",
+        help=("with --out-of-core, write results grouped by transcript "
+              "instead of in query order"))
+    translateParser.set_defaults(func=run_translate)
+
+    reverseParser = subparsers.add_parser(
+        "reverse",
+        help="map reference positions (chrom, pos) back to transcripts")
+    _add_source_arguments(reverseParser)
+    _add_stream_arguments(reverseParser)
+    reverseParser.set_defaults(func=run_reverse)
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the nvta command
+
+    :param argv: list of command line arguments, defaults to sys.argv
+    :return: exit code
+    :rtype: int
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if getattr(args, "jobs", 1) < 1:
+        parser.error("--jobs needs to be at least 1")
+    if getattr(args, "chunk_size", 1) < 1:
+        parser.error("--chunk-size needs to be at least 1")
+    if getattr(args, "memory_budget", 1) < 1:
+        parser.error("--memory-budget needs to be at least 1")
+    if getattr(args, "grouped", False) and not args.out_of_core:
+        parser.error("--grouped needs --out-of-core")
+    if getattr(args, "out_of_core", False) and args.jobs > 1:
+        parser.error("--out-of-core does not support --jobs")
+    if getattr(args, "block_size", 1) < 1:
+        parser.error("--block-size needs to be at least 1")
+    if getattr(args, "region", None) and not args.region_file:
+        parser.error("--region needs --region-file")
+
+    # library errors are raised as exceptions and reported below, keep
+    # them from reaching the last resort handler of the logging module
+    logger = logging.getLogger("nvta")
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+
+    stats = PhaseStats()
+    try:
+        args.func(args, stats)
+    except Exception as e:
+        sys.stderr.write("nvta: error: {}\n".format(
+            str(e) or type(e).__name__))
+        return 1
+    finally:
+        if args.stats:
+            stats.report()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
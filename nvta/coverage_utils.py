@@ -0,0 +1,219 @@
+"""
+Genomic coverage and splice junction aggregation of transcripts
+
+The aligned blocks (M, =, X operations) of every transcript are projected
+onto the reference and summed with a difference array: each block adds
+its weight at its start and subtracts it at its end, and a cumulative sum
+over the sorted block boundaries gives the coverage. Only the boundaries
+are stored, so memory depends on the number of blocks on a chromosome and
+not on its length. Skipped regions (N operations) are tallied as splice
+junctions.
+
+Chromosomes are processed one at a time and results are yielded per
+chromosome, so memory stays bounded by the largest chromosome.
+"""
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+from nvta.cigar_utils import (tokenize_cigars, byte_mask, exclusive_cumsum,
+                              MATCH_OPS, GAP_OPS)
+
+logger = logging.getLogger(__name__)
+
+COVERAGE_FORMAT = "{chrom}\t{start}\t{end}\t{value}\n"
+JUNCTION_FORMAT = "{chrom}\t{start}\t{end}\t{value}\n"
+
+
+def project_blocks(transcripts):
+    """
+    Project the CIGAR operations of transcripts onto the reference
+
+    :param transcripts: list of Transcripts on the same chromosome
+    :return: tuple of arrays: aligned block starts and ends, the index
+             of the transcript of each block, junction starts and ends and
+             the index of the transcript of each junction. Coordinates
+             are 0-based, ends are exclusive.
+    :rtype: tuple
+    """
+    opLengths, opCodes, opOffsets = tokenize_cigars(
+        [x.cigar for x in transcripts])
+    owners = np.repeat(np.arange(len(transcripts)), np.diff(opOffsets))
+
+    isMatch = byte_mask(opCodes, MATCH_OPS)
+    isSkip = opCodes == ord("N")
+    refLengths = np.where(isMatch | byte_mask(opCodes, GAP_OPS),
+                          opLengths, 0)
+
+    # CIGAR strings are always in reference direction, '-' transcripts
+    # start at the reference end of their alignment
+    startPositions = np.array([x.startPos for x in transcripts],
+                              dtype=np.int64)
+    refSpans = np.bincount(owners, weights=refLengths,
+                           minlength=len(transcripts)).astype(np.int64)
+    isReverse = np.array([x.direction == "-" for x in transcripts],
+                         dtype=bool)
+    leftPositions = np.where(isReverse, startPositions - refSpans + 1,
+                             startPositions)
+
+    opStarts = (leftPositions[owners] +
+                exclusive_cumsum(refLengths, owners, opOffsets))
+    opEnds = opStarts + refLengths
+
+    return (opStarts[isMatch], opEnds[isMatch], owners[isMatch],
+            opStarts[isSkip], opEnds[isSkip], owners[isSkip])
+
+
+def sum_intervals(starts, ends, weights):
+    """
+    Sum weighted intervals with a sparse difference array
+
+    :param starts: int array of interval starts
+    :param ends: int array of interval ends (exclusive)
+    :param weights: array of interval weights
+    :return: tuple of arrays with the starts, ends and values of the
+             intervals of constant, non-zero coverage
+    :rtype: tuple
+    """
+    positions, inverse = np.unique(np.concatenate((starts, ends)),
+                                   return_inverse=True)
+    deltas = np.concatenate((weights, -weights))
+    changes = np.zeros(len(positions), dtype=deltas.dtype)
+    np.add.at(changes, inverse, deltas)
+    # number of overlapping intervals, float sums of weights do not
+    # always return to exactly 0 where no interval is left
+    countChanges = np.zeros(len(positions), dtype=np.int64)
+    np.add.at(countChanges, inverse,
+              np.repeat(np.array([1, -1], dtype=np.int64), len(starts)))
+
+    values = np.cumsum(changes)[:-1]
+    counts = np.cumsum(countChanges)[:-1]
+    if np.issubdtype(values.dtype, np.floating) and len(weights):
+        # bound of the rounding error accumulated by the cumulative sum
+        tolerance = (np.finfo(values.dtype).eps * len(deltas) *
+                     np.abs(weights).max())
+        values[np.abs(values) <= tolerance] = 0
+
+    covered = (counts > 0) & (values != 0)
+    intervalStarts = positions[:-1][covered]
+    intervalEnds = positions[1:][covered]
+    values = values[covered]
+
+    # boundaries where blocks start and end at the same time do not
+    # change the coverage
+    runStarts = np.ones(len(values), dtype=bool)
+    runStarts[1:] = ((intervalStarts[1:] != intervalEnds[:-1]) |
+                     (values[1:] != values[:-1]))
+    runStarts = np.flatnonzero(runStarts)
+    runEnds = np.append(runStarts[1:], len(values)) - 1
+
+    return intervalStarts[runStarts], intervalEnds[runEnds], values[runStarts]
+
+
+def count_junctions(starts, ends, weights):
+    """
+    Tally identical junctions
+
+    :param starts: int array of junction starts
+    :param ends: int array of junction ends (exclusive)
+    :param weights: array of junction weights
+    :return: tuple of arrays with the starts, ends and summed weights of
+             the unique junctions, sorted by position
+    :rtype: tuple
+    """
+    if len(starts) == 0:
+        return starts, ends, weights
+
+    junctions, inverse = np.unique(np.stack((starts, ends), axis=1),
+                                   axis=0, return_inverse=True)
+    counts = np.zeros(len(junctions), dtype=weights.dtype)
+    np.add.at(counts, inverse.ravel(), weights)
+    return junctions[:, 0], junctions[:, 1], counts
+
+
+def iter_coverage(transcripts, weights=None, chroms=None):
+    """
+    Compute coverage and junction counts chromosome by chromosome
+
+    :param transcripts: iterable of Transcripts
+    :param weights: optional dict of transcript name to weight,
+                    transcripts not in the dict have weight 0.
+                    Without weights every transcript counts once.
+    :param chroms: optional collection of chromosomes to restrict to
+    :return: generator of dictionaries with the chromosome (chrom),
+             intervals of constant coverage (starts, ends, coverage) and
+             junctions (junctionStarts, junctionEnds, junctionCounts),
+             one per chromosome in sorted order
+    """
+    byChrom = defaultdict(list)
+    for transcript in transcripts:
+        if chroms is None or transcript.chrom in chroms:
+            byChrom[transcript.chrom].append(transcript)
+
+    for chrom in sorted(byChrom):
+        chromTranscripts = byChrom[chrom]
+        logger.info("Aggregating {} transcripts on {}".format(
+            len(chromTranscripts), chrom))
+
+        if weights is None:
+            transcriptWeights = np.ones(len(chromTranscripts), dtype=np.int64)
+        else:
+            transcriptWeights = np.array(
+                [weights.get(x.name, 0) for x in chromTranscripts],
+                dtype=np.float64)
+
+        (blockStarts, blockEnds, blockOwners,
+         skipStarts, skipEnds, skipOwners) = project_blocks(chromTranscripts)
+
+        starts, ends, coverage = sum_intervals(
+            blockStarts, blockEnds, transcriptWeights[blockOwners])
+        junctionStarts, junctionEnds, junctionCounts = count_junctions(
+            skipStarts, skipEnds, transcriptWeights[skipOwners])
+
+        yield {'chrom': chrom,
+               'starts': starts,
+               'ends': ends,
+               'coverage': coverage,
+               'junctionStarts': junctionStarts,
+               'junctionEnds': junctionEnds,
+               'junctionCounts': junctionCounts}
+
+
+def export_coverage(transcripts, coverageFile, junctionFile=None,
+                    weights=None, chroms=None):
+    """
+    Write coverage as bedGraph and junction counts as BED-like file,
+    one chromosome at a time
+
+    :param transcripts: iterable of Transcripts
+    :param coverageFile: string specifying the coverage output file
+    :param junctionFile: optional string specifying the junction
+                         output file (chrom, start, end, count)
+    :param weights: optional dict of transcript name to weight
+    :param chroms: optional collection of chromosomes to restrict to
+    :return: none
+    """
+    junctionOut = open(junctionFile, 'w') if junctionFile else None
+    try:
+        with open(coverageFile, 'w') as coverageOut:
+            for result in iter_coverage(transcripts, weights=weights,
+                                        chroms=chroms):
+                chrom = result['chrom']
+                for start, end, value in zip(result['starts'].tolist(),
+                                             result['ends'].tolist(),
+                                             result['coverage'].tolist()):
+                    coverageOut.write(COVERAGE_FORMAT.format(
+                        chrom=chrom, start=start, end=end, value=value))
+
+                if junctionOut is None:
+                    continue
+                for start, end, value in zip(
+                        result['junctionStarts'].tolist(),
+                        result['junctionEnds'].tolist(),
+                        result['junctionCounts'].tolist()):
+                    junctionOut.write(JUNCTION_FORMAT.format(
+                        chrom=chrom, start=start, end=end, value=value))
+    finally:
+        if junctionOut is not None:
+            junctionOut.close()
@@ -0,0 +1,226 @@
+"""
+Out-of-core query translation for query files larger than memory
+
+TranscriptMapper.import_queries keeps all queries in a list. The
+functions here translate a query file with bounded memory using an
+external sort-merge:
+
+1. The query file is read in runs that fit into the memory budget.
+   Every run is sorted by transcript (keeping the original line number)
+   and spilled to disk.
+2. The sorted runs are merged, so the queries arrive grouped by
+   transcript. Each group is translated in batches against its single
+   transcript, compiled once per group.
+3. Results are either written grouped by transcript, or spilled again
+   in runs sorted by line number and merged back to the original order.
+
+Merges open at most fanIn run files at once, larger numbers of runs are
+merged in several passes.
+"""
+import os
+import heapq
+import shutil
+import logging
+import tempfile
+from itertools import groupby, islice
+
+from nvta.transcript_utils import Transcript, TranscriptMapper
+from nvta.snapshot_utils import FrozenTranscript
+
+logger = logging.getLogger(__name__)
+
+QUERY_RESULT_FORMAT = "{name}\t{inputPos}\t{chrom}\t{refPos}\t{direction}\n"
+
+# default memory budget for a single run in bytes
+DEFAULT_MEMORY_BUDGET = 256 * 1024 ** 2
+# estimated Python overhead of a single record in memory
+RECORD_OVERHEAD = 200
+
+
+def _read_runs(records, memoryBudget, recordSize):
+    """
+    Split an iterable of records into lists that fit the memory budget
+
+    :param records: iterable of records
+    :param memoryBudget: int number of bytes available for a run
+    :param recordSize: function estimating the size of a record in bytes
+    :return: generator of lists of records
+    """
+    run = []
+    runSize = 0
+    for record in records:
+        run.append(record)
+        runSize += recordSize(record)
+        if runSize >= memoryBudget:
+            yield run
+            run = []
+            runSize = 0
+    if run:
+        yield run
+
+
+def _write_run(records, spillDir):
+    """
+    Write a sorted run of tab separated records to the spill directory
+
+    :param records: iterable of tuples of strings
+    :param spillDir: string specifying the spill directory
+    :return: path to the run file
+    :rtype: string
+    """
+    fd, runFile = tempfile.mkstemp(suffix=".run", dir=spillDir)
+    with os.fdopen(fd, 'w') as f:
+        for record in records:
+            f.write("\t".join(record) + "\n")
+    return runFile
+
+
+def _iter_run(runFile):
+    with open(runFile, 'r') as f:
+        for line in f:
+            yield tuple(line.rstrip("\n").split("\t"))
+
+
+def _merge_runs(runFiles, key, spillDir, fanIn):
+    """
+    Merge sorted run files into a single sorted stream of records,
+    opening at most fanIn files at once.
+
+    :param runFiles: list of paths to sorted run files
+    :param key: function giving the sort key of a record
+    :param spillDir: string specifying the spill directory
+    :param fanIn: int maximum number of run files merged at once
+    :return: generator of merged records
+    """
+    runFiles = list(runFiles)
+    while len(runFiles) > fanIn:
+        mergedRuns = []
+        for i in range(0, len(runFiles), fanIn):
+            group = runFiles[i:i + fanIn]
+            mergedRuns.append(_write_run(
+                heapq.merge(*[_iter_run(x) for x in group], key=key),
+                spillDir))
+            for runFile in group:
+                os.remove(runFile)
+        runFiles = mergedRuns
+
+    return heapq.merge(*[_iter_run(x) for x in runFiles], key=key)
+
+
+def _query_key(record):
+    # (name, line number)
+    return record[0], int(record[2])
+
+
+def _line_key(record):
+    return int(record[0])
+
+
+def _translate_groups(mapper, queries, batchSize):
+    """
+    Translate queries sorted by transcript, one transcript at a time
+
+    :param mapper: TranscriptMapper or FrozenTranscriptMapper
+    :param queries: iterable of (name, position, line number) tuples
+                    sorted by transcript name
+    :param batchSize: int maximum number of queries translated at once
+    :return: generator of (line number, formatted result) tuples
+    """
+    transcripts = mapper.get_transcripts()
+    for name, group in groupby(queries, key=lambda x: x[0]):
+        if name not in transcripts:
+            logger.error(("Input query contains a transcript "
+                          "that has not been loaded"))
+            raise ValueError("Transcript {} not loaded".format(name))
+
+        transcript = transcripts[name]
+        if not isinstance(transcript, FrozenTranscript):
+            transcript = FrozenTranscript.from_transcript(transcript)
+
+        while True:
+            batch = list(islice(group, batchSize))
+            if not batch:
+                break
+            positions = [int(x[1]) for x in batch]
+            refPositions = transcript.translate_batch(positions)
+
+            for record, position, refPos in zip(batch, positions,
+                                                refPositions.tolist()):
+                yield record[2], QUERY_RESULT_FORMAT.format(
+                    name=name, inputPos=position, chrom=transcript.chrom,
+                    refPos=Transcript.format_ref_coordinate(refPos),
+                    direction=transcript.direction)
+
+
+def translate_query_file(mapper, inputFile, outputFile, spillDir=None,
+                         memoryBudget=DEFAULT_MEMORY_BUDGET, grouped=False,
+                         fanIn=64):
+    """
+    Translate a query file of any size with bounded memory
+
+    :param mapper: TranscriptMapper or FrozenTranscriptMapper with the
+                   transcripts of all queries imported
+    :param inputFile: string containing path to query file.
+    :param outputFile: string specifying the output file
+    :param spillDir: string specifying the directory for temporary run
+                     files, defaults to the system temp directory
+    :param memoryBudget: int number of bytes a single run may use
+    :param grouped: bool, write results grouped by transcript instead of
+                    in the order of the query file
+    :param fanIn: int maximum number of run files merged at once
+    :return: number of translated queries
+    :rtype: int
+    """
+    if not os.path.exists(inputFile):
+        raise FileNotFoundError("{} not found".format(inputFile))
+
+    if memoryBudget <= 0:
+        raise ValueError("Memory budget needs to be positive")
+
+    if fanIn < 2:
+        raise ValueError("fanIn needs to be at least 2")
+
+    workDir = tempfile.mkdtemp(prefix="nvta_", dir=spillDir)
+    # results are formatted lines, roughly twice the size of a query
+    batchSize = max(1, memoryBudget // (2 * RECORD_OVERHEAD))
+    count = 0
+
+    try:
+        logger.info("Sorting queries from {} by transcript".format(inputFile))
+        queryRuns = []
+        with open(inputFile, 'r') as f:
+            queries = ((lineSplit[0], lineSplit[1], str(i))
+                       for i, lineSplit in enumerate(
+                           TranscriptMapper.check_query_line(x)
+                           for x in f if x.strip()))
+            for run in _read_runs(queries, memoryBudget,
+                                  lambda x: RECORD_OVERHEAD + len(x[0])):
+                run.sort(key=_query_key)
+                queryRuns.append(_write_run(run, workDir))
+                count += len(run)
+
+        logger.info("Translating {} queries".format(count))
+        sortedQueries = _merge_runs(queryRuns, _query_key, workDir, fanIn)
+        results = _translate_groups(mapper, sortedQueries, batchSize)
+
+        with open(outputFile, 'w') as out:
+            if grouped:
+                for lineNumber, result in results:
+                    out.write(result)
+            else:
+                resultRuns = []
+                for run in _read_runs(results, memoryBudget,
+                                      lambda x: RECORD_OVERHEAD + len(x[1])):
+                    run.sort(key=lambda x: int(x[0]))
+                    # results are kept without their line break in runs
+                    resultRuns.append(_write_run(
+                        ((x[0], x[1][:-1]) for x in run), workDir))
+
+                logger.info("Restoring query order")
+                for record in _merge_runs(resultRuns, _line_key, workDir,
+                                          fanIn):
+                    out.write("\t".join(record[1:]) + "\n")
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    return count
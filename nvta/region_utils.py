@@ -0,0 +1,251 @@
+"""
+Block-compressed, region-indexed transcript files
+
+A region file holds the lines of a transcript file sorted by chromosome
+and leftmost reference position, compressed in independent gzip blocks
+of about BLOCK_SIZE uncompressed bytes. Blocks never span two
+chromosomes. Concatenated gzip blocks are a valid gzip file, so the
+region file can still be read with zcat or get_transcript_info_from_file
+after decompression.
+
+The companion index (<region file>.nvi) lists every block with its
+chromosome, the reference region covered by its transcripts and its
+position in the region file:
+
+    #nvta region index
+    chrom   start   end     offset  size
+
+Loading the transcripts overlapping a region only reads and decompresses
+the blocks whose region overlaps it.
+
+Regions are 0-based with exclusive ends, like all other coordinates in
+this package. They are given as 'chrom', 'chrom:start-end' or as
+(chrom, start, end) tuples.
+"""
+import os
+import zlib
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+from nvta.transcript_utils import TranscriptMapper
+from nvta.cigar_utils import reference_spans
+
+logger = logging.getLogger(__name__)
+
+# uncompressed bytes per block
+BLOCK_SIZE = 64 * 1024
+INDEX_HEADER = "#nvta region index\n"
+INDEX_SUFFIX = ".nvi"
+
+
+def get_index_file(regionFile):
+    """
+    Path of the index belonging to a region file
+
+    :param regionFile: string containing path to region file.
+    :return: path to the index file
+    :rtype: string
+    """
+    return regionFile + INDEX_SUFFIX
+
+
+def _compress_block(data):
+    # gzip container, so that concatenated blocks form a gzip file
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _decompress_block(data):
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+
+def build_region_file(inputFile, outputFile, blockSize=BLOCK_SIZE):
+    """
+    Sort a transcript file by position, compress it in blocks
+    and write the region index next to it.
+
+    :param inputFile: string containing path to a transcript file.
+    :param outputFile: string specifying the region file to write,
+                       the index is written to outputFile + '.nvi'
+    :param blockSize: int number of uncompressed bytes per block
+    :return: number of blocks written
+    :rtype: int
+    """
+    if blockSize <= 0:
+        raise ValueError("Block size needs to be positive")
+
+    info = TranscriptMapper.get_transcript_info_from_file(inputFile)
+    # the last transcript of a duplicated name wins, as in
+    # TranscriptMapper.import_transcripts
+    info = list({x['name']: x for x in info}.values())
+    lefts, rights = reference_spans([x['startPos'] for x in info],
+                                    [x['cigar'] for x in info],
+                                    [x['direction'] for x in info])
+
+    chroms = np.array([x['chrom'] for x in info], dtype=np.str_)
+    order = np.lexsort((rights, lefts, chroms))
+
+    logger.info("Writing Region File {}".format(outputFile))
+    blocks = []
+    lines = []
+    blockChrom = None
+    blockStart = blockEnd = 0
+    blockBytes = 0
+    offset = 0
+
+    with open(outputFile, 'wb') as out:
+
+        def flush():
+            data = _compress_block("".join(lines).encode())
+            out.write(data)
+            blocks.append((blockChrom, blockStart, blockEnd, offset,
+                           len(data)))
+            return offset + len(data)
+
+        for i in order.tolist():
+            item = info[i]
+            line = "{name}\t{chrom}\t{startPos}\t{cigar}\t{direction}\n"\
+                .format(**item)
+
+            if lines and (item['chrom'] != blockChrom or
+                          blockBytes + len(line) > blockSize):
+                offset = flush()
+                lines = []
+
+            if not lines:
+                blockChrom = item['chrom']
+                blockStart = int(lefts[i])
+                blockEnd = int(rights[i])
+                blockBytes = 0
+
+            lines.append(line)
+            blockBytes += len(line)
+            blockEnd = max(blockEnd, int(rights[i]))
+
+        if lines:
+            flush()
+
+    with open(get_index_file(outputFile), 'w') as f:
+        f.write(INDEX_HEADER)
+        for block in blocks:
+            f.write("\t".join(str(x) for x in block) + "\n")
+
+    return len(blocks)
+
+
+def read_region_index(indexFile):
+    """
+    Read the blocks of a region index
+
+    :param indexFile: string containing path to index file.
+    :return: dict of chromosome to list of (start, end, offset, size)
+             tuples of its blocks
+    :rtype: dict
+    """
+    if not os.path.exists(indexFile):
+        raise FileNotFoundError("{} not found".format(indexFile))
+
+    blocks = defaultdict(list)
+    with open(indexFile, 'r') as f:
+        if f.readline() != INDEX_HEADER:
+            raise Exception("{} is not a region index".format(indexFile))
+        for line in f:
+            lineSplit = line.rstrip("\n").split("\t")
+            if len(lineSplit) != 5:
+                raise Exception("Index lines must have 5 tab separated "
+                                "entries.")
+            blocks[lineSplit[0]].append(tuple(int(x) for x in
+                                              lineSplit[1:]))
+    return dict(blocks)
+
+
+def parse_region(region):
+    """
+    Parse a region into a (chrom, start, end) tuple
+
+    :param region: string 'chrom' or 'chrom:start-end', or a tuple
+    :return: tuple of chromosome, start and end (None for open ends)
+    :rtype: tuple
+    """
+    if not isinstance(region, str):
+        chrom, start, end = region
+        return chrom, start, end
+
+    if ":" not in region:
+        return region, None, None
+
+    chrom, interval = region.rsplit(":", 1)
+    try:
+        start, end = [int(x.replace(",", "")) for x in interval.split("-")]
+    except ValueError:
+        raise ValueError(("Region {} needs to be formatted as "
+                          "chrom:start-end".format(region)))
+    if start >= end:
+        raise ValueError("Region {} is empty".format(region))
+    return chrom, start, end
+
+
+def _overlaps(left, right, start, end):
+    return (start is None or right > start) and (end is None or left < end)
+
+
+def get_transcript_info_from_regions(regionFile, regions):
+    """
+    Read the transcripts overlapping any of the regions from a
+    region file, decompressing only the blocks that are needed.
+
+    :param regionFile: string containing path to region file.
+    :param regions: list of regions, see parse_region
+    :return: list of dictionaries containing transcript information,
+             in the same format as get_transcript_info_from_file
+    :rtype: list
+    """
+    if not os.path.exists(regionFile):
+        raise FileNotFoundError("{} not found".format(regionFile))
+
+    index = read_region_index(get_index_file(regionFile))
+    regionsByChrom = defaultdict(list)
+    for region in regions:
+        chrom, start, end = parse_region(region)
+        regionsByChrom[chrom].append((start, end))
+
+    inputTranscripts = []
+    numBlocks = 0
+    logger.info("Reading Transcript Regions from {}".format(regionFile))
+    with open(regionFile, 'rb') as f:
+        for chrom in sorted(regionsByChrom):
+            chromRegions = regionsByChrom[chrom]
+            for blockStart, blockEnd, offset, size in index.get(chrom, []):
+                if not any(_overlaps(blockStart, blockEnd, start, end)
+                           for start, end in chromRegions):
+                    continue
+
+                f.seek(offset)
+                lines = _decompress_block(f.read(size)).decode().splitlines()
+                numBlocks += 1
+
+                info = []
+                for line in lines:
+                    lineSplit = TranscriptMapper.check_transcript_line(line)
+                    info.append({'name': lineSplit[0],
+                                 'chrom': lineSplit[1],
+                                 'startPos': int(lineSplit[2]),
+                                 'cigar': lineSplit[3],
+                                 'direction': lineSplit[4]})
+
+                lefts, rights = reference_spans(
+                    [x['startPos'] for x in info],
+                    [x['cigar'] for x in info],
+                    [x['direction'] for x in info])
+
+                for item, left, right in zip(info, lefts.tolist(),
+                                             rights.tolist()):
+                    if any(_overlaps(left, right, start, end)
+                           for start, end in chromRegions):
+                        inputTranscripts.append(item)
+
+    logger.info("Read {} transcripts from {} blocks".format(
+        len(inputTranscripts), numBlocks))
+    return inputTranscripts
@@ -0,0 +1,325 @@
+"""
+Mapper-wide segment store in CSR layout
+
+SegmentStore keeps the compiled segments of every transcript in flat,
+concatenated arrays. The segments of transcript i are found at
+segStarts[offsets[i]:offsets[i + 1]] (and the same slice of segEnds and
+segAdjustments), with per transcript columns for strand, chromosome id,
+start position and last transcript position.
+
+Every segment also gets a global key (its start shifted by the summed
+lengths of all preceding transcripts), so a mixed batch of
+(transcript, position) pairs translates with one searchsorted call
+instead of a Python loop over transcripts.
+
+The store is saved as a directory of .npy files, which can be memory
+mapped read-only so several processes share one copy of the data. The
+derived arrays (segment keys and the sorted name index) are saved as
+well, so loading does not compute anything in private memory.
+"""
+import os
+import logging
+
+import numpy as np
+
+from nvta.snapshot_utils import compile_segments, format_ref_coordinates
+
+logger = logging.getLogger(__name__)
+
+# written to FORMAT_FILE by save and checked by load, increase the
+# version whenever the arrays of a saved store change
+FORMAT_NAME = "nvta segment store"
+FORMAT_VERSION = 1
+FORMAT_FILE = "format.txt"
+
+
+def _as_str_array(values):
+    # keeps memory mapped string arrays instead of copying them
+    values = np.asarray(values)
+    if values.dtype.kind != 'U':
+        values = values.astype(np.str_)
+    return values
+
+
+class SegmentStore():
+    """
+    Flat, read-only store of the segments of all transcripts
+
+    - Build from a TranscriptMapper or FrozenTranscriptMapper
+    - Translate mixed batches of (transcript, position) pairs in one pass
+    - Save to and load from a directory of .npy files
+    """
+
+    # arrays describing the transcripts
+    storedFields = ('names', 'chromNames', 'chromIds', 'strands',
+                    'startPositions', 'cigars', 'offsets', 'segStarts',
+                    'segEnds', 'segAdjustments')
+    # arrays computed from storedFields, saved as well
+    derivedFields = ('transcriptEnds', 'lengthOffsets', 'segKeys',
+                     'sortedNames', 'nameOrder')
+
+    def __init__(self, names, chromNames, chromIds, strands, startPositions,
+                 cigars, offsets, segStarts, segEnds, segAdjustments,
+                 **derived):
+        """
+        Initiate the store from CSR arrays
+
+        :param names: array of transcript names
+        :param chromNames: array of chromosome names, indexed by chromIds
+        :param chromIds: int array with the chromosome id of each transcript
+        :param strands: int array with 1 for '+' and -1 for '-' transcripts
+        :param startPositions: int array of reference start positions
+        :param cigars: array of CIGAR strings
+        :param offsets: int array of length n + 1 with the first segment
+                        of each transcript in the segment arrays
+        :param segStarts: int array of segment starts on the transcript
+        :param segEnds: int array of segment ends on the transcript
+        :param segAdjustments: float array of segment adjustment values
+        :param derived: optional arrays of derivedFields, as written by
+                        save. Missing arrays are computed.
+        :return: none
+        """
+        self.names = _as_str_array(names)
+        self.chromNames = _as_str_array(chromNames)
+        self.chromIds = np.asarray(chromIds, dtype=np.int32)
+        self.strands = np.asarray(strands, dtype=np.int8)
+        self.startPositions = np.asarray(startPositions, dtype=np.int64)
+        self.cigars = _as_str_array(cigars)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.segStarts = np.asarray(segStarts, dtype=np.int64)
+        self.segEnds = np.asarray(segEnds, dtype=np.int64)
+        self.segAdjustments = np.asarray(segAdjustments, dtype=np.float64)
+
+        if len(self.offsets) != len(self.names) + 1:
+            raise ValueError("offsets need one more entry than transcripts")
+
+        unknown = set(derived) - set(self.derivedFields)
+        if unknown:
+            raise TypeError("Unknown arrays {}".format(sorted(unknown)))
+
+        if set(derived) == set(self.derivedFields):
+            for field, array in derived.items():
+                setattr(self, field, np.asarray(array))
+        else:
+            self._derive_arrays()
+
+        for field in self.storedFields + self.derivedFields:
+            getattr(self, field).setflags(write=False)
+
+    def _derive_arrays(self):
+        """
+        Internal helper computing the arrays of derivedFields
+        """
+        # last segment of every transcript ends after its last position
+        if len(self.names):
+            self.transcriptEnds = self.segEnds[self.offsets[1:] - 1] - 1
+        else:
+            self.transcriptEnds = np.zeros(0, dtype=np.int64)
+        self.lengthOffsets = np.concatenate(
+            ([0], np.cumsum(self.transcriptEnds + 1)))
+
+        segmentOwner = np.repeat(np.arange(len(self.names)),
+                                 np.diff(self.offsets))
+        self.segKeys = self.segStarts + self.lengthOffsets[segmentOwner]
+
+        # names are looked up by binary search in the sorted names
+        self.nameOrder = np.argsort(self.names, kind='stable')
+        self.sortedNames = self.names[self.nameOrder]
+        if np.any(self.sortedNames[1:] == self.sortedNames[:-1]):
+            raise ValueError("Transcript names need to be unique")
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_mapper(cls, mapper):
+        """
+        Create a segment store from the transcripts of a mapper
+
+        :param mapper: TranscriptMapper or FrozenTranscriptMapper
+        :return: segment store holding all transcripts of the mapper
+        :rtype: SegmentStore
+        """
+        transcripts = list(mapper.get_transcripts().values())
+
+        chromNames = sorted(set(x.chrom for x in transcripts))
+        chromIndex = {chrom: i for i, chrom in enumerate(chromNames)}
+
+        segments = []
+        for transcript in transcripts:
+            if hasattr(transcript, 'segStarts'):
+                # frozen transcripts are already compiled
+                segments.append((transcript.segStarts, transcript.segEnds,
+                                 transcript.segAdjustments))
+            else:
+                segments.append(compile_segments(transcript))
+
+        counts = [len(x[0]) for x in segments]
+        offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+
+        def concatenate(index, dtype):
+            if not segments:
+                return np.zeros(0, dtype=dtype)
+            return np.concatenate([x[index] for x in segments])
+
+        return cls(names=[x.name for x in transcripts],
+                   chromNames=chromNames,
+                   chromIds=[chromIndex[x.chrom] for x in transcripts],
+                   strands=[-1 if x.direction == "-" else 1
+                            for x in transcripts],
+                   startPositions=[x.startPos for x in transcripts],
+                   cigars=[x.cigar for x in transcripts],
+                   offsets=offsets,
+                   segStarts=concatenate(0, np.int64),
+                   segEnds=concatenate(1, np.int64),
+                   segAdjustments=concatenate(2, np.float64))
+
+    def transcript_ids(self, names):
+        """
+        Convert transcript names to their index in the store
+
+        :param names: sequence of transcript names
+        :return: int array of transcript indices
+        :rtype: numpy.ndarray
+        """
+        names = np.asarray(names, dtype=np.str_)
+        index = np.searchsorted(self.sortedNames, names)
+        found = index < len(self.sortedNames)
+        found[found] = self.sortedNames[index[found]] == names[found]
+        if not np.all(found):
+            logger.error(("Input query contains a transcript "
+                          "that has not been loaded"))
+            raise ValueError("Transcript {} not loaded".format(
+                names[~found][0]))
+        return self.nameOrder[index].astype(np.int64)
+
+    def get_info(self, transcriptId):
+        """
+        Accessor for the information of a single transcript
+
+        :param transcriptId: int index of the transcript in the store
+        :return: A dictionary with the transcript
+                 name, chromosome, start position, CIGAR string, and direction
+        :rtype: dict
+        """
+        transcriptInfo = {
+                          'name': str(self.names[transcriptId]),
+                          'chrom': str(self.chromNames[
+                              self.chromIds[transcriptId]]),
+                          'startPos': int(self.startPositions[transcriptId]),
+                          'cigar': str(self.cigars[transcriptId]),
+                          'direction': "-" if self.strands[transcriptId] < 0
+                                       else "+"
+                          }
+        return transcriptInfo
+
+    def get_segments(self, transcriptId):
+        """
+        Accessor for the segments of a single transcript
+
+        :param transcriptId: int index of the transcript in the store
+        :return: tuple of segment start, end and adjustment array views
+        :rtype: tuple
+        """
+        start = self.offsets[transcriptId]
+        end = self.offsets[transcriptId + 1]
+        return (self.segStarts[start:end], self.segEnds[start:end],
+                self.segAdjustments[start:end])
+
+    def translate_batch(self, transcriptIds, positions):
+        """
+        Translate a mixed batch of transcript positions in a single pass
+
+        :param transcriptIds: int array of transcript indices
+                              (see transcript_ids)
+        :param positions: int array of transcript coordinates
+        :return: float array of reference positions in input order.
+                 Inserted bases carry the insertion base as decimal.
+        :rtype: numpy.ndarray
+        """
+        transcriptIds = np.asarray(transcriptIds, dtype=np.int64)
+        positions = np.asarray(positions, dtype=np.int64)
+
+        if transcriptIds.shape != positions.shape:
+            raise ValueError(("transcript ids and positions need to have "
+                              "equal length"))
+
+        if np.any((transcriptIds < 0) | (transcriptIds >= len(self))):
+            raise ValueError("Transcript id out of bounds.")
+
+        if np.any((positions < 0) |
+                  (positions > self.transcriptEnds[transcriptIds])):
+            logger.error("Input position out of transcript bounds.")
+            raise ValueError("Position outside of transcript.")
+
+        keys = self.lengthOffsets[transcriptIds] + positions
+        index = np.searchsorted(self.segKeys, keys, side='right') - 1
+
+        refPositions = (self.segAdjustments[index] +
+                        self.strands[transcriptIds] * positions)
+        return format_ref_coordinates(refPositions)
+
+    def translate_names(self, names, positions):
+        """
+        Translate a mixed batch of (transcript name, position) pairs
+
+        :param names: sequence of transcript names
+        :param positions: int array of transcript coordinates
+        :return: tuple of chromosome name array and float array of
+                 reference positions in input order
+        :rtype: tuple
+        """
+        transcriptIds = self.transcript_ids(names)
+        refPositions = self.translate_batch(transcriptIds, positions)
+        chroms = self.chromNames[self.chromIds[transcriptIds]]
+        return chroms, refPositions
+
+    def save(self, outputDir):
+        """
+        Save the store as a directory of .npy files
+
+        :param outputDir: string specifying the output directory,
+                          created if it does not exist
+        :return: none
+        """
+        os.makedirs(outputDir, exist_ok=True)
+        for field in self.storedFields + self.derivedFields:
+            np.save(os.path.join(outputDir, field + ".npy"),
+                    getattr(self, field), allow_pickle=False)
+        with open(os.path.join(outputDir, FORMAT_FILE), 'w') as f:
+            f.write("{}\t{}\n".format(FORMAT_NAME, FORMAT_VERSION))
+
+    @classmethod
+    def load(cls, inputDir, mmap=True):
+        """
+        Load a store saved with save
+
+        :param inputDir: string containing path to the store directory
+        :param mmap: bool, memory map the segment arrays read-only so
+                     processes loading the same store share the pages
+        :return: loaded segment store
+        :rtype: SegmentStore
+        """
+        if not os.path.exists(inputDir):
+            raise FileNotFoundError("{} not found".format(inputDir))
+
+        formatFile = os.path.join(inputDir, FORMAT_FILE)
+        expected = "{}\t{}".format(FORMAT_NAME, FORMAT_VERSION)
+        storeFormat = None
+        if os.path.isfile(formatFile):
+            with open(formatFile, 'r') as f:
+                storeFormat = f.readline().rstrip("\n")
+        if storeFormat != expected:
+            logger.error(("{} is not a segment store of version {}, "
+                          "found {}".format(inputDir, FORMAT_VERSION,
+                                            storeFormat)))
+            raise ValueError(("{} is not a segment store of this version, "
+                              "please rebuild it".format(inputDir)))
+
+        logger.info("Reading Segment Store from {}".format(inputDir))
+        mmapMode = 'r' if mmap else None
+        arrays = {}
+        for field in cls.storedFields + cls.derivedFields:
+            arrays[field] = np.load(os.path.join(inputDir, field + ".npy"),
+                                    mmap_mode=mmapMode, allow_pickle=False)
+        return cls(**arrays)
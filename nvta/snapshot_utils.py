@@ -0,0 +1,325 @@
+"""
+Read-only snapshots of loaded transcripts for concurrent queries
+
+A TranscriptMapper keeps per-run state (queries and query results) next
+to the loaded transcripts, so a single instance cannot be shared between
+threads. FrozenTranscriptMapper holds only immutable data: the interval
+trees of every transcript are compiled into sorted, read-only NumPy arrays
+and every query method returns its results instead of storing them.
+
+Batch translation runs entirely in NumPy (searchsorted, take and
+arithmetic on numeric arrays), which releases the GIL, so threads sharing
+one snapshot scale across cores.
+"""
+import logging
+from types import MappingProxyType
+
+import numpy as np
+
+from nvta.transcript_utils import Transcript
+
+logger = logging.getLogger(__name__)
+
+
+def format_ref_coordinates(adjustedCoordinates):
+    """
+    Array version of Transcript.format_ref_coordinate
+
+    Inserted bases are formatted one by one with
+    Transcript.format_ref_coordinate, so that batch results are
+    identical to single queries.
+
+    :param adjustedCoordinates: float array of reference coordinates
+    :return: float array of reported reference positions
+    :rtype: numpy.ndarray
+    """
+    refPositions = np.array(adjustedCoordinates, dtype=np.float64)
+    insertions = np.flatnonzero(refPositions != np.floor(refPositions))
+    refPositions[insertions] = [
+        Transcript.format_ref_coordinate(x)
+        for x in refPositions[insertions].tolist()]
+    return refPositions
+
+
+def compile_segments(transcript):
+    """
+    Compile the IntervalTree of a transcript into sorted arrays
+
+    :param transcript: Transcript object
+    :return: tuple of read-only arrays with the transcript start (inclusive)
+             and end (exclusive) of every interval and its adjustment value
+    :rtype: tuple
+    """
+    if transcript.segments is not None:
+        # bulk built transcripts are compiled already
+        return transcript.segments
+
+    intervals = sorted(transcript.conversionTree)
+    segStarts = np.array([x.begin for x in intervals], dtype=np.int64)
+    segEnds = np.array([x.end for x in intervals], dtype=np.int64)
+    segAdjustments = np.array([x.data for x in intervals], dtype=np.float64)
+
+    for array in (segStarts, segEnds, segAdjustments):
+        array.setflags(write=False)
+    return segStarts, segEnds, segAdjustments
+
+
+class FrozenTranscript():
+    """
+    Immutable, compiled version of a Transcript
+
+    - Translate single coordinates with the same results as Transcript
+    - Translate arrays of coordinates in a single vectorized call
+    """
+
+    __slots__ = ('name', 'chrom', 'startPos', 'cigar', 'direction',
+                 'transcriptEnd', 'segStarts', 'segEnds', 'segAdjustments')
+
+    def __init__(self, name, chrom, startPos, cigar, direction,
+                 segStarts, segEnds, segAdjustments):
+        """
+        Initiate a frozen transcript from compiled segments
+
+        :param name: string describing the transcript name
+        :param chrom: string for transcript chromosome (ex. chr1, chr2)
+        :param startPos: int specifying start position on reference
+        :param cigar: string containing the CIGAR string of the transcript
+        :param direction: string specifying the transcript direction.
+        :param segStarts: array of interval starts on the transcript
+        :param segEnds: array of interval ends on the transcript
+        :param segAdjustments: array of interval adjustment values
+        :return: none
+        """
+        for attr, value in (('name', name), ('chrom', chrom),
+                            ('startPos', startPos), ('cigar', cigar),
+                            ('direction', direction),
+                            ('transcriptEnd', int(segEnds[-1]) - 1),
+                            ('segStarts', segStarts),
+                            ('segEnds', segEnds),
+                            ('segAdjustments', segAdjustments)):
+            object.__setattr__(self, attr, value)
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("FrozenTranscript is read-only")
+
+    def __delattr__(self, attr):
+        raise AttributeError("FrozenTranscript is read-only")
+
+    @classmethod
+    def from_transcript(cls, transcript):
+        """
+        Create a frozen copy of a Transcript
+
+        :param transcript: Transcript object
+        :return: frozen transcript
+        :rtype: FrozenTranscript
+        """
+        info = transcript.get_info()
+        segStarts, segEnds, segAdjustments = compile_segments(transcript)
+        return cls(segStarts=segStarts, segEnds=segEnds,
+                   segAdjustments=segAdjustments, **info)
+
+    def get_info(self):
+        """
+        Accessor method to get the transcript information
+
+        :return: A dictionary with the transcript
+                 name, chromosome, start position, CIGAR string, and direction
+        :rtype: dict
+        """
+        transcriptInfo = {
+                          'name': self.name,
+                          'chrom': self.chrom,
+                          'startPos': self.startPos,
+                          'cigar': self.cigar,
+                          'direction': self.direction
+                          }
+        return transcriptInfo
+
+    def translate_batch(self, positions):
+        """
+        Translate an array of transcript positions to reference positions
+
+        :param positions: array-like of int transcript coordinates
+        :return: float array of reference positions. Inserted bases carry
+                 the insertion base as decimal (ex. 23.1)
+        :rtype: numpy.ndarray
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+
+        if positions.size and (positions.min() < 0 or
+                               positions.max() > self.transcriptEnd):
+            logger.error("Input position out of transcript bounds.")
+            raise ValueError("Position outside of transcript.")
+
+        index = np.searchsorted(self.segStarts, positions, side='right') - 1
+        adjustments = self.segAdjustments.take(index)
+
+        if self.direction == "-":
+            refPositions = adjustments - positions
+        else:
+            refPositions = adjustments + positions
+        return format_ref_coordinates(refPositions)
+
+    def translate_coordinates(self, inputPosition):
+        """
+        Translate a transcript position to the reference position
+
+        :param inputPosition: int specifying the transcript
+                              coordinate to be translated
+        :return: dictionary containing the transcript name (name)
+                 input position (inputPos), chromosome (chrom),
+                 translated ref position (refPos),
+                 and direction (direction).
+        :rtype: dict
+        """
+        if inputPosition < 0:
+            logger.error("Please use a valid position")
+            raise ValueError("Negative position given.")
+
+        if inputPosition > self.transcriptEnd:
+            logger.error("Input position out of transcript bounds.")
+            raise ValueError("Position exceeding transript length.")
+
+        index = int(np.searchsorted(self.segStarts, inputPosition,
+                                    side='right')) - 1
+        posAdjustment = self.segAdjustments[index].item()
+
+        if self.direction == "-":
+            adjustedCoordinate = posAdjustment - inputPosition
+        else:
+            adjustedCoordinate = inputPosition + posAdjustment
+
+        results = {'name': self.name,
+                   'inputPos': inputPosition,
+                   'chrom': self.chrom,
+                   'refPos': Transcript.format_ref_coordinate(
+                       adjustedCoordinate),
+                   'direction': self.direction}
+
+        return results
+
+
+class FrozenTranscriptMapper():
+    """
+    Read-only snapshot of a TranscriptMapper that can be shared between
+    threads. Features include:
+
+    - Run single queries or lists of queries without storing results
+    - Translate batches of (name, position) pairs in NumPy
+    """
+
+    __slots__ = ('transcripts',)
+
+    def __init__(self, transcripts):
+        """
+        Initiate a snapshot from frozen transcripts
+
+        :param transcripts: dict of FrozenTranscripts with names as keys
+        :return: none
+        """
+        object.__setattr__(self, 'transcripts',
+                           MappingProxyType(dict(transcripts)))
+
+    def __setattr__(self, attr, value):
+        raise AttributeError("FrozenTranscriptMapper is read-only")
+
+    def __delattr__(self, attr):
+        raise AttributeError("FrozenTranscriptMapper is read-only")
+
+    @classmethod
+    def from_mapper(cls, mapper):
+        """
+        Create a snapshot of the transcripts loaded in a TranscriptMapper
+
+        :param mapper: TranscriptMapper with imported transcripts
+        :return: snapshot of the mapper
+        :rtype: FrozenTranscriptMapper
+        """
+        frozen = {}
+        for name, transcript in mapper.get_transcripts().items():
+            frozen[name] = FrozenTranscript.from_transcript(transcript)
+        return cls(frozen)
+
+    def get_transcripts(self, name=None):
+        """
+        Accessor for transcripts
+
+        :param name: string specifying a transcript name to retrieve
+        :return: read-only mapping of frozen transcripts
+        :rtype: mappingproxy
+        """
+        if name is None:
+            return self.transcripts
+        else:
+            if name in self.transcripts:
+                return self.transcripts[name]
+            else:
+                raise Exception("Transcript not found.")
+
+    def run_single_query(self, name, queryPos):
+        """
+        Method to run a single query
+
+        :param name: string specifying the transcript name
+        :param queryPos: int specifying the transcript position to translate.
+        :return: single query result
+        :rtype: dict
+        """
+        try:
+            transcript = self.transcripts[name]
+        except KeyError:
+            logger.error(("Input query contains a transcript "
+                          "that has not been loaded"))
+            raise ValueError("Transcript {} not loaded".format(name))
+        return transcript.translate_coordinates(queryPos)
+
+    def run_queries(self, queries):
+        """
+        Method to run a list of queries
+
+        :param queries: list of dictionaries with name and queryPos,
+                        as returned by TranscriptMapper.get_query_from_file
+        :return: list of dictionaries containing query results
+        :rtype: list
+        """
+        return [self.run_single_query(**x) for x in queries]
+
+    def translate_batch(self, names, positions):
+        """
+        Translate a batch of (transcript name, position) pairs
+
+        :param names: sequence of transcript names
+        :param positions: array-like of int transcript coordinates
+        :return: float array of reference positions in input order
+        :rtype: numpy.ndarray
+        """
+        names = np.asarray(names)
+        positions = np.asarray(positions, dtype=np.int64)
+
+        if names.shape != positions.shape:
+            raise ValueError("names and positions need to have equal length")
+
+        refPositions = np.empty(positions.shape, dtype=np.float64)
+        uniqueNames, inverse = np.unique(names, return_inverse=True)
+
+        # group the queries of each transcript once instead of
+        # masking the whole batch per transcript
+        order = np.argsort(inverse.ravel(), kind='stable')
+        bounds = np.searchsorted(inverse.ravel()[order],
+                                 np.arange(len(uniqueNames) + 1))
+        flatPositions = positions.ravel()
+        flatResults = refPositions.reshape(-1)
+
+        for i, name in enumerate(uniqueNames.tolist()):
+            try:
+                transcript = self.transcripts[name]
+            except KeyError:
+                logger.error(("Input query contains a transcript "
+                              "that has not been loaded"))
+                raise ValueError("Transcript {} not loaded".format(name))
+            group = order[bounds[i]:bounds[i + 1]]
+            flatResults[group] = transcript.translate_batch(
+                flatPositions[group])
+
+        return refPositions
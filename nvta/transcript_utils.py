@@ -1,7 +1,10 @@
 import re
 import os
 import logging
+from bisect import bisect_right
+from collections import defaultdict
 from intervaltree import IntervalTree
+from nvta.backend_utils import select_backend, create_backend, get_segments
 
 logger = logging.getLogger(__name__)
 
@@ -35,12 +38,101 @@ class Transcript():
         self.chrom = chrom
         self.startPos = startPos
         self.direction = direction
+        # compiled segments, only set for transcripts built in bulk
+        self.segments = None
         # validate cigar
         self.cigar = self.verify_cigar(cigar)
         # create interval tree based on cigar
         self.conversionTree = self.process_cigar()
         # get max transcript position
         self.transcriptEnd = self.conversionTree.end() - 1
+        # reference ordered match segments, built on first reverse query
+        self._reverseSegments = None
+        # how coordinates are looked up, chosen on the first query
+        self._backend = None
+
+    @classmethod
+    def from_segments(cls, name, chrom, startPos, cigar, direction,
+                      segStarts, segEnds, segAdjustments):
+        """
+        Create a transcript from already compiled segments, skipping
+        CIGAR validation and processing (see nvta.cigar_utils).
+        The IntervalTree is only built when it is accessed.
+
+        :param name: string describing the transcript name
+        :param chrom: string for transcript chromosome (ex. chr1, chr2)
+        :param startPos: int specifying start position on reference
+        :param cigar: string containing the CIGAR string of the transcript
+        :param direction: string specifying the transcript direction.
+        :param segStarts: sorted array of interval starts on the transcript
+        :param segEnds: array of interval ends on the transcript
+        :param segAdjustments: array of interval adjustment values
+        :return: transcript ready to be queried
+        :rtype: Transcript
+        """
+        transcript = cls.__new__(cls)
+        transcript.name = name
+        transcript.chrom = chrom
+        transcript.startPos = startPos
+        transcript.direction = direction
+        transcript.cigar = cigar
+        transcript.segments = (segStarts, segEnds, segAdjustments)
+        transcript._conversionTree = None
+        transcript.transcriptEnd = int(segEnds[-1]) - 1
+        transcript._reverseSegments = None
+        transcript._backend = None
+        return transcript
+
+    @property
+    def conversionTree(self):
+        if self._conversionTree is None:
+            segStarts, segEnds, segAdjustments = self.segments
+            self._conversionTree = IntervalTree.from_tuples(
+                zip(segStarts.tolist(), segEnds.tolist(),
+                    segAdjustments.tolist()))
+        return self._conversionTree
+
+    @conversionTree.setter
+    def conversionTree(self, conversionTree):
+        self._conversionTree = conversionTree
+
+    def get_num_segments(self):
+        """
+        Accessor for the number of intervals used for translation
+
+        :return: number of intervals, one per match operation
+                 and one per inserted base
+        :rtype: int
+        """
+        if self._conversionTree is None:
+            return len(self.segments[0])
+        return len(self._conversionTree)
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self.set_backend()
+        return self._backend
+
+    def set_backend(self, backendName=None, queryFrequency=None):
+        """
+        Set the backend used by translate_coordinates
+        (see nvta.backend_utils). Without calling this method, the
+        backend is picked automatically on the first query.
+
+        :param backendName: string with the backend name ('tree', 'sorted'
+                            or 'dense'). If not given, the backend is
+                            picked from the number of intervals, the
+                            transcript length and queryFrequency.
+        :param queryFrequency: optional number of expected queries
+        :return: none
+        """
+        if backendName is None:
+            backendName = select_backend(
+                self.get_num_segments(), self.transcriptEnd + 1,
+                queryFrequency=queryFrequency,
+                hasTree=self._conversionTree is not None)
+        self._backend = create_backend(self, backendName)
 
     def get_info(self):
         """
@@ -200,38 +292,154 @@ class Transcript():
             logger.error("Input position out of transcript bounds.")
             raise ValueError("Position exceeding transript length.")
 
-        intervalSet = self.conversionTree[inputPosition]
-        if len(intervalSet) > 1:
-            logger.error("Overlapping intervals detected!")
-            raise Exception("Error in interval tree")
-
-        elif len(intervalSet) == 0:
-            logger.error("No interval for position detected!")
-            raise Exception("Error in interval tree")
-
-        else:
-            posAdjustment = intervalSet.pop().data
+        posAdjustment = self.backend.lookup(inputPosition)
 
         if self.direction == "-":
             adjustedCoordinate = posAdjustment - inputPosition
         else:
             adjustedCoordinate = inputPosition + posAdjustment
 
+        refCoordinate = self.format_ref_coordinate(adjustedCoordinate)
+
+        results = {'name': self.name,
+                   'inputPos': inputPosition,
+                   'chrom': self.chrom,
+                   'refPos': refCoordinate,
+                   'direction': self.direction}
+
+        return results
+
+    @staticmethod
+    def format_ref_coordinate(adjustedCoordinate):
+        """
+        Convert an adjusted coordinate to the reported reference position
+
+        :param adjustedCoordinate: int or float reference coordinate
+        :return: int for aligned bases, float with the insertion base
+                 as decimal for inserted bases
+        :rtype: int or float
+        """
         # this is not super clean, but was required to deal with
         # python's floating point arithmetic limitations
         if float(adjustedCoordinate).is_integer():
-            refCoordinate = int(adjustedCoordinate)
+            return int(adjustedCoordinate)
+        else:
+            return float(format(adjustedCoordinate, '.1f'))
+
+    def reverse_translate_coordinates(self, refPosition):
+        """
+        Translate a reference position back to the transcript position
+
+        Only bases aligned to the reference (M, =, X) can be reverse mapped.
+        Positions falling into deletions, skipped regions or outside of the
+        transcript raise a ValueError.
+
+        :param refPosition: int specifying the reference
+                            coordinate to be translated
+        :return: dictionary containing the transcript name (name)
+                 input reference position (refPos), chromosome (chrom),
+                 translated transcript position (transcriptPos),
+                 and direction (direction).
+        :rtype: dict
+        """
+        if self._reverseSegments is None:
+            self._reverseSegments = self._build_reverse_segments()
+        refStarts, refEnds, adjustments = self._reverseSegments
+
+        i = bisect_right(refStarts, refPosition) - 1
+        if i < 0 or refPosition >= refEnds[i]:
+            raise ValueError(("Reference position {} is not aligned to "
+                              "transcript {}".format(refPosition,
+                                                     self.name)))
+
+        if self.direction == "-":
+            transcriptPos = adjustments[i] - refPosition
         else:
-            refCoordinate = float(format(adjustedCoordinate, '.1f'))
+            transcriptPos = refPosition - adjustments[i]
 
         results = {'name': self.name,
-                   'inputPos': inputPosition,
+                   'refPos': refPosition,
                    'chrom': self.chrom,
-                   'refPos': refCoordinate,
+                   'transcriptPos': transcriptPos,
                    'direction': self.direction}
 
         return results
 
+    def _build_reverse_segments(self):
+        """
+        Internal helper listing the reference intervals of all
+        match segments in reference order.
+
+        :return: tuple of lists with the reference start, reference end
+                 (exclusive) and adjustment value of every match segment
+        :rtype: tuple
+        """
+        refStarts = []
+        refEnds = []
+        adjustments = []
+        segments = [x.tolist() for x in get_segments(self)]
+        for start, end, adjustment in zip(*segments):
+            if not float(adjustment).is_integer():
+                # insertion bases have no reference base of their own
+                continue
+            adjustment = int(adjustment)
+            if self.direction == "-":
+                refStarts.append(adjustment - end + 1)
+                refEnds.append(adjustment - start + 1)
+            else:
+                refStarts.append(adjustment + start)
+                refEnds.append(adjustment + end)
+            adjustments.append(adjustment)
+
+        if self.direction == "-":
+            # segments of '-' transcripts run backwards on the reference
+            refStarts.reverse()
+            refEnds.reverse()
+            adjustments.reverse()
+        return refStarts, refEnds, adjustments
+
+
+class TranscriptDict(dict):
+    """
+    Dictionary of transcripts by name that counts its modifications,
+    so that indices built from it can tell when they are outdated.
+    """
+
+    # class default, also used while unpickling
+    version = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        super().clear()
+        self.version += 1
+
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        self.version += 1
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        self.version += 1
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+
 
 class TranscriptMapper():
     """
@@ -248,6 +456,21 @@ class TranscriptMapper():
         self.transcripts = {}
         self.queryResults = []
         self.queries = []
+        # reference spans of the transcripts by chromosome,
+        # see build_reverse_index
+        self._reverseIndex = None
+        self._reverseIndexKey = None
+
+    @property
+    def transcripts(self):
+        return self._transcripts
+
+    @transcripts.setter
+    def transcripts(self, transcripts):
+        # keep track of changes to the transcripts for the reverse index
+        if not isinstance(transcripts, TranscriptDict):
+            transcripts = TranscriptDict(transcripts)
+        self._transcripts = transcripts
 
     def get_queries(self, index=None):
         """
@@ -315,14 +538,165 @@ class TranscriptMapper():
             tmpTxDict[item['name']] = Transcript(**item)
         return tmpTxDict
 
-    def import_transcripts(self, inputFile):
+    @classmethod
+    def from_arrays(cls, names, chroms, starts, cigars, strands):
+        """
+        Build a mapper from column arrays of transcript information.
+        All CIGAR strings are processed at once with array operations
+        instead of one Transcript at a time (see nvta.cigar_utils).
+
+        :param names: sequence of transcript names
+        :param chroms: sequence of chromosome names
+        :param starts: sequence of int reference start positions
+        :param cigars: sequence of CIGAR strings
+        :param strands: sequence of '+' or '-' transcript directions
+        :return: mapper with compiled transcripts ready to query
+        :rtype: TranscriptMapper
+        """
+        from nvta.cigar_utils import compile_transcripts
+
+        # like importing one transcript at a time, the last transcript
+        # of a duplicated name wins and keeps the position of the first
+        latest = {}
+        for i, name in enumerate(names):
+            latest[name] = i
+        if len(latest) < len(names):
+            logger.warning(("Duplicate transcript names detected, "
+                            "keeping the last transcript of each name"))
+            keep = list(latest.values())
+            names, chroms, starts, cigars, strands = [
+                [x[i] for i in keep]
+                for x in (names, chroms, starts, cigars, strands)]
+
+        store = compile_transcripts(names, chroms, starts, cigars, strands)
+        return cls.from_segment_store(store)
+
+    @classmethod
+    def from_segment_store(cls, store):
+        """
+        Build a mapper from the compiled transcripts of a segment store.
+        Transcripts keep views of the store arrays, so a memory mapped
+        store is not copied.
+
+        :param store: SegmentStore (see nvta.segment_utils)
+        :return: mapper with compiled transcripts ready to query
+        :rtype: TranscriptMapper
+        """
+        mapper = cls()
+        for i in range(len(store)):
+            segStarts, segEnds, segAdjustments = store.get_segments(i)
+            transcript = Transcript.from_segments(
+                segStarts=segStarts, segEnds=segEnds,
+                segAdjustments=segAdjustments, **store.get_info(i))
+            mapper.transcripts[transcript.name] = transcript
+        return mapper
+
+    def _bulk_build_transcripts(self, transcriptInfo):
+        """
+        Internal wrapper building transcripts with from_arrays.
+
+        :param transcriptInfo: list of dictionaries containing
+                               transcript information
+        :return: dict of Transcripts with transcript names as keys
+        :rtype: dict
+        """
+        mapper = self.from_arrays(
+            names=[x['name'] for x in transcriptInfo],
+            chroms=[x['chrom'] for x in transcriptInfo],
+            starts=[x['startPos'] for x in transcriptInfo],
+            cigars=[x['cigar'] for x in transcriptInfo],
+            strands=[x['direction'] for x in transcriptInfo])
+        return mapper.transcripts
+
+    def import_transcripts(self, inputFile, bulk=False, backend=None,
+                           queryFrequency=None):
         """
         Main method for importing transcripts from files.
 
         :param inputFile: string containing path to input file.
+        :param bulk: bool, process all CIGAR strings at once
+                     (see from_arrays), recommended for large files
+        :param backend: optional backend override, see set_backends
+        :param queryFrequency: optional dict of transcript name to the
+                               expected number of queries
+        :return: none
+        """
+        if bulk:
+            info = self.get_transcript_info_from_file(inputFile)
+            self.transcripts = self._bulk_build_transcripts(info)
+        else:
+            self.transcripts = self._build_transcripts(inputFile)
+
+        if backend is not None or queryFrequency is not None:
+            self.set_backends(backend=backend, queryFrequency=queryFrequency)
+
+    def import_transcript_regions(self, regionFile, regions, bulk=False,
+                                  backend=None, queryFrequency=None):
+        """
+        Import only the transcripts overlapping the given reference
+        regions from a region file (see nvta.region_utils). Only the
+        compressed blocks overlapping the regions are read.
+
+        :param regionFile: string containing path to region file.
+        :param regions: list of regions as 'chrom', 'chrom:start-end'
+                        or (chrom, start, end) tuples, 0-based with
+                        exclusive ends
+        :param bulk: bool, process all CIGAR strings at once
+        :param backend: optional backend override, see set_backends
+        :param queryFrequency: optional dict of transcript name to the
+                               expected number of queries
         :return: none
         """
-        self.transcripts = self._build_transcripts(inputFile)
+        from nvta.region_utils import get_transcript_info_from_regions
+
+        info = get_transcript_info_from_regions(regionFile, regions)
+        if bulk:
+            self.transcripts = self._bulk_build_transcripts(info)
+        else:
+            self.transcripts = {x['name']: Transcript(**x) for x in info}
+
+        if backend is not None or queryFrequency is not None:
+            self.set_backends(backend=backend, queryFrequency=queryFrequency)
+
+    def set_backends(self, backend=None, queryFrequency=None):
+        """
+        Method to (re)select the translation backend of the imported
+        transcripts (see nvta.backend_utils).
+
+        :param backend: optional string with a backend name used for all
+                        transcripts ('tree', 'sorted' or 'dense'), or dict
+                        of transcript name to backend name. Transcripts
+                        without an override are selected automatically.
+        :param queryFrequency: optional dict of transcript name to the
+                               expected number of queries, for example
+                               collections.Counter of the query names
+        :return: none
+        """
+        if queryFrequency is None:
+            queryFrequency = {}
+
+        for name, transcript in self.transcripts.items():
+            if isinstance(backend, dict):
+                backendName = backend.get(name)
+            else:
+                backendName = backend
+            transcript.set_backend(backendName=backendName,
+                                   queryFrequency=queryFrequency.get(name))
+
+    def get_backend_report(self):
+        """
+        Accessor for the translation backend of every imported transcript
+
+        :return: list of dictionaries with the transcript name (name),
+                 backend name (backend), number of intervals (numSegments)
+                 and transcript length (length)
+        :rtype: list
+        """
+        return [{'name': name,
+                 'backend': transcript.backend.name,
+                 'numSegments': transcript.get_num_segments(),
+                 'length': transcript.transcriptEnd + 1}
+                for name, transcript in self.transcripts.items()]
 
     def import_queries(self, inputFile):
         """
@@ -358,9 +732,191 @@ class TranscriptMapper():
         except KeyError:
             logger.error(("Input query contains a transcript "
                           "that has not been loaded"))
-            raise ValueError
+            raise ValueError("Transcript {} not loaded".format(name))
         return result
 
+    def run_queries_out_of_core(self, inputFile, outputFile, spillDir=None,
+                                memoryBudget=None, grouped=False):
+        """
+        Method to translate a query file larger than memory and write the
+        results to a file, without importing the queries to the object.
+        Queries are sorted by transcript on disk in runs that fit the
+        memory budget (see nvta.external_sort_utils).
+
+        :param inputFile: string containing path to query file.
+        :param outputFile: string specifying the output file
+        :param spillDir: string specifying the directory for temporary
+                         files, defaults to the system temp directory
+        :param memoryBudget: int number of bytes a single run may use
+        :param grouped: bool, write results grouped by transcript instead
+                        of in the order of the query file
+        :return: number of translated queries
+        :rtype: int
+        """
+        from nvta.external_sort_utils import (translate_query_file,
+                                              DEFAULT_MEMORY_BUDGET)
+
+        if memoryBudget is None:
+            memoryBudget = DEFAULT_MEMORY_BUDGET
+
+        return translate_query_file(self, inputFile, outputFile,
+                                    spillDir=spillDir,
+                                    memoryBudget=memoryBudget,
+                                    grouped=grouped)
+
+    def run_reverse_query(self, chrom, refPos):
+        """
+        Method to map a single reference position back to all
+        loaded transcripts that have a base aligned to it.
+
+        :param chrom: string specifying the chromosome
+        :param refPos: int specifying the reference position to translate.
+        :return: list of reverse query results, one per matching transcript
+        :rtype: list
+        """
+        # rebuild the index if the transcripts were replaced or changed
+        if self._reverseIndex is None or \
+                self._reverseIndexKey[0] is not self.transcripts or \
+                self._reverseIndexKey[1] != self.transcripts.version:
+            self.build_reverse_index()
+
+        results = []
+        if chrom not in self._reverseIndex:
+            return results
+
+        # keep the order in which transcripts were loaded
+        for interval in sorted(self._reverseIndex[chrom][refPos],
+                               key=lambda x: x.data[0]):
+            try:
+                results.append(
+                    interval.data[1].reverse_translate_coordinates(refPos))
+            except ValueError:
+                continue
+        return results
+
+    def build_reverse_index(self):
+        """
+        Index the reference region covered by every transcript in one
+        IntervalTree per chromosome, used by run_reverse_query.
+        The index is built on the first reverse query and rebuilt
+        whenever transcripts are imported, added, replaced or removed.
+
+        :return: none
+        """
+        from nvta.cigar_utils import reference_spans
+
+        transcripts = list(self.transcripts.values())
+        spansByChrom = defaultdict(list)
+        if transcripts:
+            lefts, rights = reference_spans([x.startPos for x in transcripts],
+                                            [x.cigar for x in transcripts],
+                                            [x.direction for x in transcripts])
+            for i, (transcript, left, right) in enumerate(
+                    zip(transcripts, lefts.tolist(), rights.tolist())):
+                spansByChrom[transcript.chrom].append(
+                    (left, right, (i, transcript)))
+
+        self._reverseIndex = {chrom: IntervalTree.from_tuples(spans)
+                              for chrom, spans in spansByChrom.items()}
+        self._reverseIndexKey = (self.transcripts, self.transcripts.version)
+
+    def freeze(self):
+        """
+        Create a read-only snapshot of the imported transcripts that can
+        be queried concurrently from multiple threads.
+
+        :return: snapshot of the imported transcripts
+        :rtype: FrozenTranscriptMapper
+        """
+        # imported here to keep numpy out of the import of this module
+        from nvta.snapshot_utils import FrozenTranscriptMapper
+
+        return FrozenTranscriptMapper.from_mapper(self)
+
+    def build_segment_store(self):
+        """
+        Collect the segments of all imported transcripts into a single
+        flat store that translates mixed batches in one vectorized pass.
+
+        :return: store holding the segments of all imported transcripts
+        :rtype: SegmentStore
+        """
+        from nvta.segment_utils import SegmentStore
+
+        return SegmentStore.from_mapper(self)
+
+    def iter_coverage(self, weights=None, chroms=None):
+        """
+        Method to project the aligned blocks of all imported transcripts
+        onto the reference and aggregate coverage and splice junctions,
+        one chromosome at a time (see nvta.coverage_utils).
+
+        :param weights: optional dict of transcript name to weight,
+                        without weights every transcript counts once
+        :param chroms: optional collection of chromosomes to restrict to
+        :return: generator of dictionaries with the chromosome (chrom),
+                 intervals of constant coverage (starts, ends, coverage)
+                 and junctions (junctionStarts, junctionEnds,
+                 junctionCounts), one per chromosome
+        """
+        from nvta.coverage_utils import iter_coverage
+
+        return iter_coverage(self.transcripts.values(), weights=weights,
+                             chroms=chroms)
+
+    def export_coverage(self, coverageFile, junctionFile=None, weights=None,
+                        chroms=None):
+        """
+        Method to write the coverage of all imported transcripts as
+        bedGraph, and optionally the junction counts to a second file.
+
+        :param coverageFile: string specifying the coverage output file
+        :param junctionFile: string specifying the junction output file
+        :param weights: optional dict of transcript name to weight
+        :param chroms: optional collection of chromosomes to restrict to
+        :return: none
+        """
+        from nvta.coverage_utils import export_coverage
+
+        export_coverage(self.transcripts.values(), coverageFile,
+                        junctionFile=junctionFile, weights=weights,
+                        chroms=chroms)
+
+    def export_index(self, outputDir):
+        """
+        Method to save the imported transcripts as a prebuilt index,
+        so that they do not have to be processed again on the next run.
+        The index is a versioned segment store directory of .npy files
+        (see nvta.segment_utils).
+
+        :param outputDir: string specifying the output directory,
+                          created if it does not exist
+        :return: none
+        """
+        try:
+            self.build_segment_store().save(outputDir)
+        except IOError:
+            raise Exception("Cannot access output directory.")
+
+    def import_index(self, inputDir, mmap=True):
+        """
+        Method for importing transcripts from an index created
+        with export_index.
+
+        :param inputDir: string containing path to index directory.
+        :param mmap: bool, memory map the index read-only so processes
+                     loading the same index share its pages
+        :return: none
+        """
+        from nvta.segment_utils import SegmentStore
+
+        if not os.path.exists(inputDir):
+            raise FileNotFoundError("{} not found".format(inputDir))
+
+        logger.info("Reading Transcript Index from {}".format(inputDir))
+        store = SegmentStore.load(inputDir, mmap=mmap)
+        self.transcripts = self.from_segment_store(store).transcripts
+
     def export_query_results(self, outputFile):
         """
         Method to exort saved query results to file.
@@ -469,3 +1025,24 @@ class TranscriptMapper():
         except ValueError:
             raise Exception("Second entry needs to be an integer")
         return lineSplit
+
+    @staticmethod
+    def check_reverse_query_line(line):
+        """
+        Helper method to verify a line of a reverse query input file
+
+        :param line: string containing a single line from a
+                     reverse query file (chromosome and reference position).
+        :return: list of elements in line separated by tab.
+        :rtype: list
+        """
+        lineSplit = line.strip().split("\t")
+
+        if len(lineSplit) != 2:
+            raise Exception("Input file must have 2 tab separated entries.")
+
+        try:
+            int(lineSplit[1])
+        except ValueError:
+            raise Exception("Second entry needs to be an integer")
+        return lineSplit
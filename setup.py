@@ -33,7 +33,8 @@ setup(name="nvta",
       author="Jin Hyun Ju",
       author_email="jinhyun.ju@gmail.com",
       packages=['nvta'],
-      install_requires=["intervaltree"],
+      install_requires=["intervaltree", "numpy"],
+      entry_points={'console_scripts': ['nvta=nvta.cli:main']},
       test_suite="pytest",
       tests_require=["pytest"],
       cmdclass={'test': PyTest}
@@ -0,0 +1,126 @@
+import os
+import sys
+import subprocess
+import pytest
+from collections import Counter
+from nvta.transcript_utils import Transcript, TranscriptMapper
+from nvta.backend_utils import (BACKENDS, select_backend, create_backend,
+                                TranslationBackend, TREE_MAX_SEGMENTS,
+                                DENSE_MAX_LENGTH)
+
+"""
+Resources for testing
+"""
+
+resourceDir = "./tests/resources"
+
+exampleTranscriptFile = os.path.join(resourceDir,
+                                     "example_transcript_input.tsv")
+
+exampleQueryFile = os.path.join(resourceDir,
+                                "example_query.tsv")
+
+
+"""
+Testing starts here
+"""
+
+
+def test_backends_match():
+
+    for cigar, startPos, direction in [("8M7D6M2I2M11D7M", 3, "+"),
+                                       ("8M7D6M2I2M11D7M", 43, "-"),
+                                       ("2M3D2I4M7D1M2I7M11D7M", 5, "+"),
+                                       ("2M3D2I4M7D1M2I7M11D7M", 46, "-")]:
+        transcript = Transcript("TR1", "CHR1", startPos, cigar, direction)
+        expected = [transcript.translate_coordinates(i)
+                    for i in range(0, transcript.transcriptEnd + 1)]
+
+        for backendName in BACKENDS:
+            transcript.set_backend(backendName)
+            assert transcript.backend.name == backendName
+
+            for i in range(0, transcript.transcriptEnd + 1):
+                assert transcript.translate_coordinates(i) == expected[i]
+
+            with pytest.raises(ValueError):
+                transcript.translate_coordinates(-1)
+
+            with pytest.raises(ValueError):
+                transcript.translate_coordinates(
+                    transcript.transcriptEnd + 1)
+
+    with pytest.raises(ValueError):
+        create_backend(transcript, "hash")
+
+    # backends need to implement lookup
+    class IncompleteBackend(TranslationBackend):
+        def __init__(self, transcript):
+            pass
+
+    with pytest.raises(TypeError):
+        IncompleteBackend(transcript)
+
+
+def test_select_backend():
+
+    assert select_backend(1, 1000) == "tree"
+    assert select_backend(TREE_MAX_SEGMENTS + 1, 1000) == "sorted"
+    assert select_backend(TREE_MAX_SEGMENTS + 1, 1000,
+                          queryFrequency=10) == "sorted"
+    assert select_backend(1, 1000, queryFrequency=5000) == "dense"
+    assert select_backend(1, DENSE_MAX_LENGTH + 1,
+                          queryFrequency=10 ** 9) == "tree"
+    assert select_backend(1, 1000, hasTree=False) == "sorted"
+
+    # automatic selection when transcripts are built
+    assert Transcript("TR1", "CHR1", 3, "20M").backend.name == "tree"
+    assert Transcript("TR1", "CHR1", 3,
+                      "1M1I" * TREE_MAX_SEGMENTS).backend.name == "sorted"
+
+
+def test_mapper_backends():
+    testMapper = TranscriptMapper()
+    queryFrequency = Counter(
+        x['name'] for x in TranscriptMapper.get_query_from_file(
+            exampleQueryFile) * 20)
+
+    testMapper.import_transcripts(exampleTranscriptFile,
+                                  queryFrequency=queryFrequency)
+
+    assert testMapper.get_backend_report() == [
+        {'name': 'TR1', 'backend': 'dense', 'numSegments': 6, 'length': 25},
+        {'name': 'TR2', 'backend': 'dense', 'numSegments': 1, 'length': 20},
+        {'name': 'TR3', 'backend': 'dense', 'numSegments': 6, 'length': 25}]
+
+    testMapper.set_backends(backend={"TR2": "sorted"})
+    assert [x['backend'] for x in testMapper.get_backend_report()] == \
+        ["tree", "sorted", "tree"]
+
+    # bulk built transcripts do not build an IntervalTree by default
+    bulkMapper = TranscriptMapper()
+    bulkMapper.import_transcripts(exampleTranscriptFile, bulk=True)
+    assert [x['backend'] for x in bulkMapper.get_backend_report()] == \
+        ["sorted", "sorted", "sorted"]
+
+    testMapper.import_queries(exampleQueryFile)
+    testMapper.run_all_queries()
+    expected = testMapper.get_query_results()
+
+    for backendName in BACKENDS:
+        bulkMapper = TranscriptMapper()
+        bulkMapper.import_transcripts(exampleTranscriptFile, bulk=True,
+                                      backend=backendName)
+        bulkMapper.import_queries(exampleQueryFile)
+        bulkMapper.run_all_queries()
+
+        assert bulkMapper.get_query_results() == expected
+        assert set(x['backend'] for x in bulkMapper.get_backend_report()) \
+            == {backendName}
+
+
+def test_numpy_imported_lazily():
+    # importing the mapper does not pull in numpy (fast CLI start up)
+    subprocess.check_call([sys.executable, "-c", (
+        "import sys, nvta.transcript_utils; "
+        "assert 'numpy' not in sys.modules")])
@@ -0,0 +1,136 @@
+import os
+import pytest
+import numpy as np
+from nvta.transcript_utils import Transcript, TranscriptMapper
+from nvta.cigar_utils import tokenize_cigars, compile_transcripts
+
+"""
+Resources for testing
+"""
+
+resourceDir = "./tests/resources"
+
+exampleTranscriptFile = os.path.join(resourceDir,
+                                     "example_transcript_input.tsv")
+
+exampleQueryFile = os.path.join(resourceDir,
+                                "example_query.tsv")
+
+exampleTranscripts = [("TR1", "CHR1", 3, "8M7D6M2I2M11D7M", "+"),
+                      ("TR2", "CHR1", 43, "8M7D6M2I2M11D7M", "-"),
+                      ("TR3", "CHR2", 5, "2M3D2I4M7D1M2I7M11D7M", "+"),
+                      ("TR4", "CHR2", 46, "2M3D2I4M7D1M2I7M11D7M", "-"),
+                      ("TR5", "CHR3", 10, "20M", "+"),
+                      ("TR6", "CHR3", 1000, "3=1X12I5N4M", "-")]
+
+
+"""
+Testing starts here
+"""
+
+
+def test_tokenize_cigars():
+
+    opLengths, opCodes, opOffsets = tokenize_cigars(["8M7D6M", "20M",
+                                                     "123N1I"])
+
+    assert opLengths.tolist() == [8, 7, 6, 20, 123, 1]
+    assert bytes(opCodes) == b"MDMMNI"
+    assert opOffsets.tolist() == [0, 3, 4, 6]
+
+    # same checks as Transcript.verify_cigar
+    for invalidCigar in ["8M7D6M2I2M11D7M9O", "8MD7I", "M8", "8M7",
+                         "", "8m", "8Mé7D"]:
+        with pytest.raises(ValueError):
+            tokenize_cigars(["20M", invalidCigar])
+
+    for unsupportedCigar in ["3S8M", "8M2H", "2P8M"]:
+        with pytest.raises(ValueError):
+            tokenize_cigars([unsupportedCigar])
+
+
+def test_compile_transcripts():
+
+    store = compile_transcripts(*zip(*exampleTranscripts))
+
+    for i, info in enumerate(exampleTranscripts):
+        transcript = Transcript(*info)
+        intervals = sorted(transcript.conversionTree)
+        segStarts, segEnds, segAdjustments = store.get_segments(i)
+
+        assert store.get_info(i) == transcript.get_info()
+        assert segStarts.tolist() == [x.begin for x in intervals]
+        assert segEnds.tolist() == [x.end for x in intervals]
+        assert segAdjustments.tolist() == [x.data for x in intervals]
+
+    with pytest.raises(ValueError):
+        compile_transcripts(["TR1"], ["CHR1"], [3], ["8M"], ["*"])
+
+    with pytest.raises(ValueError):
+        compile_transcripts(["TR1"], ["CHR1"], [3], ["8M", "4M"], ["+"])
+
+    # transcripts need at least one aligned base
+    with pytest.raises(ValueError):
+        compile_transcripts(["TR1"], ["CHR1"], [3], ["8D"], ["+"])
+
+
+def test_from_arrays():
+
+    bulkMapper = TranscriptMapper.from_arrays(*zip(*exampleTranscripts))
+
+    for info in exampleTranscripts:
+        transcript = Transcript(*info)
+        bulkTranscript = bulkMapper.get_transcripts(info[0])
+
+        assert bulkTranscript.transcriptEnd == transcript.transcriptEnd
+
+        for i in range(0, transcript.transcriptEnd + 1):
+            assert bulkTranscript.translate_coordinates(i) == \
+                transcript.translate_coordinates(i)
+
+        with pytest.raises(ValueError):
+            bulkTranscript.translate_coordinates(transcript.transcriptEnd + 1)
+
+        # the interval tree is built on demand
+        assert bulkTranscript.conversionTree == transcript.conversionTree
+
+
+def test_import_transcripts_bulk():
+    testMapper = TranscriptMapper()
+    testMapper.import_transcripts(exampleTranscriptFile)
+    testMapper.import_queries(exampleQueryFile)
+    testMapper.run_all_queries()
+
+    bulkMapper = TranscriptMapper()
+    bulkMapper.import_transcripts(exampleTranscriptFile, bulk=True)
+    bulkMapper.import_queries(exampleQueryFile)
+    bulkMapper.run_all_queries()
+
+    assert bulkMapper.get_query_results() == testMapper.get_query_results()
+    assert bulkMapper.run_reverse_query("CHR1", 7) == \
+        testMapper.run_reverse_query("CHR1", 7)
+
+    frozenMapper = bulkMapper.freeze()
+    assert np.array_equal(frozenMapper.translate_batch(["TR3"], [9]),
+                          [24.1])
+
+
+def test_import_transcripts_bulk_duplicates(tmpdir):
+    transcriptFile = tmpdir.join("duplicates.tsv")
+    transcriptFile.write("TR1\tCHR1\t3\t8M7D6M2I2M11D7M\t+\n"
+                         "TR2\tCHR2\t10\t20M\t+\n"
+                         "TR1\tCHR2\t50\t5M\t-\n")
+
+    testMapper = TranscriptMapper()
+    testMapper.import_transcripts(str(transcriptFile))
+
+    bulkMapper = TranscriptMapper()
+    bulkMapper.import_transcripts(str(transcriptFile), bulk=True)
+
+    # the last transcript of a name wins in both import paths
+    assert list(bulkMapper.get_transcripts()) == \
+        list(testMapper.get_transcripts()) == ["TR1", "TR2"]
+    assert bulkMapper.get_transcripts("TR1").get_info() == \
+        testMapper.get_transcripts("TR1").get_info()
+    assert bulkMapper.run_single_query("TR1", 0) == \
+        testMapper.run_single_query("TR1", 0)
@@ -0,0 +1,180 @@
+import os
+import sys
+import subprocess
+import pytest
+from nvta import cli
+
+"""
+Resources for testing
+"""
+
+resourceDir = "./tests/resources"
+
+exampleTranscriptFile = os.path.join(resourceDir,
+                                     "example_transcript_input.tsv")
+
+exampleQueryFile = os.path.join(resourceDir,
+                                "example_query.tsv")
+
+expectedQueryOutput = ("TR1\t4\tCHR1\t7\t+\n"
+                       "TR2\t0\tCHR2\t10\t+\n"
+                       "TR3\t0\tCHR1\t43\t-\n"
+                       "TR1\t13\tCHR1\t23\t+\n"
+                       "TR2\t10\tCHR2\t20\t+\n"
+                       "TR3\t9\tCHR1\t24.1\t-\n")
+
+
+"""
+Testing starts here
+"""
+
+
+def test_translate(tmpdir):
+    outputFile = str(tmpdir.join("results.tsv"))
+
+    exitCode = cli.main(["translate", "-t", exampleTranscriptFile,
+                         "-o", outputFile, exampleQueryFile])
+
+    assert exitCode == 0
+    with open(outputFile) as f:
+        assert f.read() == expectedQueryOutput
+
+
+def test_translate_parallel_from_index(tmpdir):
+    indexFile = str(tmpdir.join("transcripts.idx"))
+    outputFile = str(tmpdir.join("results.tsv"))
+
+    assert cli.main(["index", "-t", exampleTranscriptFile,
+                     "-o", indexFile]) == 0
+
+    exitCode = cli.main(["translate", "-x", indexFile, "-j", "2",
+                         "--chunk-size", "2", "-o", outputFile,
+                         exampleQueryFile])
+
+    assert exitCode == 0
+    with open(outputFile) as f:
+        # parallel execution keeps the order of the query file
+        assert f.read() == expectedQueryOutput
+
+
+def test_reverse(tmpdir):
+    queryFile = tmpdir.join("reverse.tsv")
+    queryFile.write("CHR1\t7\nCHR2\t10\nCHR2\t500\n")
+    outputFile = str(tmpdir.join("results.tsv"))
+
+    exitCode = cli.main(["reverse", "-t", exampleTranscriptFile,
+                         "-o", outputFile, str(queryFile)])
+
+    assert exitCode == 0
+    with open(outputFile) as f:
+        assert f.read() == ("CHR1\t7\tTR1\t4\t+\n"
+                            "CHR1\t7\tTR3\t20\t-\n"
+                            "CHR2\t10\tTR2\t0\t+\n")
+
+
+def test_stats(tmpdir, capsys):
+    outputFile = str(tmpdir.join("results.tsv"))
+
+    cli.main(["--stats", "translate", "-t", exampleTranscriptFile,
+              "-o", outputFile, exampleQueryFile])
+
+    err = capsys.readouterr().err
+    assert "load" in err
+    assert "translate" in err
+    assert "records/s" in err
+
+    # with worker processes the load phase covers loading in the workers
+    cli.main(["--stats", "translate", "-t", exampleTranscriptFile, "-j", "2",
+              "-o", outputFile, exampleQueryFile])
+
+    loadLine = [x for x in capsys.readouterr().err.splitlines()
+                if "load" in x][0]
+    assert loadLine.split()[4:6] == ["3", "records"]
+
+    # failed loads in workers are reported instead of restarting workers
+    exitCode = cli.main(["translate", "-t", str(tmpdir.join("missing")),
+                         "-j", "2", "-o", outputFile, exampleQueryFile])
+    assert exitCode == 1
+
+
+def test_errors(tmpdir, capsys, monkeypatch):
+    queryFile = tmpdir.join("missing.tsv")
+    queryFile.write("TR9\t4\n")
+
+    exitCode = cli.main(["translate", "-t", exampleTranscriptFile,
+                         str(queryFile)])
+
+    assert exitCode == 1
+    assert capsys.readouterr().err == \
+        "nvta: error: Transcript TR9 not loaded\n"
+
+    # exceptions without a message report their type
+    def fail(args, stats):
+        raise ValueError
+
+    monkeypatch.setattr(cli, "run_translate", fail)
+    exitCode = cli.main(["translate", "-t", exampleTranscriptFile,
+                         str(queryFile)])
+
+    assert exitCode == 1
+    assert capsys.readouterr().err == "nvta: error: ValueError\n"
+
+    with pytest.raises(SystemExit):
+        cli.main(["translate", exampleQueryFile])
+
+
+def test_errors_reported_once():
+    # outside of pytest no log handler is installed
+    result = subprocess.run([sys.executable, "-m", "nvta.cli", "translate",
+                             "-t", exampleTranscriptFile, "-"],
+                            input="TR9\t1\n", stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+
+    assert result.returncode == 1
+    assert result.stdout == ""
+    assert result.stderr == "nvta: error: Transcript TR9 not loaded\n"
+
+
+def test_translate_out_of_core(tmpdir):
+    outputFile = str(tmpdir.join("results.tsv"))
+
+    exitCode = cli.main(["translate", "-t", exampleTranscriptFile,
+                         "--out-of-core", "--memory-budget", "1",
+                         "--spill-dir", str(tmpdir), "-o", outputFile,
+                         exampleQueryFile])
+
+    assert exitCode == 0
+    with open(outputFile) as f:
+        assert f.read() == expectedQueryOutput
+
+    with pytest.raises(SystemExit):
+        cli.main(["translate", "-t", exampleTranscriptFile, "--grouped",
+                  "-o", outputFile, exampleQueryFile])
+
+    with pytest.raises(SystemExit):
+        cli.main(["translate", "-t", exampleTranscriptFile, "--out-of-core",
+                  "-j", "2", "-o", outputFile, exampleQueryFile])
+
+
+def test_translate_from_region_file(tmpdir):
+    regionFile = str(tmpdir.join("transcripts.tsv.gz"))
+    outputFile = str(tmpdir.join("results.tsv"))
+
+    assert cli.main(["compress", "-t", exampleTranscriptFile,
+                     "-o", regionFile]) == 0
+
+    exitCode = cli.main(["translate", "-R", regionFile, "-o", outputFile,
+                         exampleQueryFile])
+
+    assert exitCode == 0
+    with open(outputFile) as f:
+        assert f.read() == expectedQueryOutput
+
+    # TR2 is on CHR2 and not loaded
+    exitCode = cli.main(["translate", "-R", regionFile, "--region", "CHR1",
+                         "-o", outputFile, exampleQueryFile])
+    assert exitCode == 1
+
+    with pytest.raises(SystemExit):
+        cli.main(["translate", "-t", exampleTranscriptFile,
+                  "--region", "CHR1", exampleQueryFile])
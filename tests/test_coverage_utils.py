@@ -0,0 +1,152 @@
+import os
+from collections import Counter
+import numpy as np
+from nvta.transcript_utils import Transcript, TranscriptMapper
+from nvta.coverage_utils import sum_intervals, count_junctions
+
+"""
+Resources for testing
+"""
+
+resourceDir = "./tests/resources"
+
+exampleTranscriptFile = os.path.join(resourceDir,
+                                     "example_transcript_input.tsv")
+
+
+def create_mock_mapper():
+    """
+    Utility function to create a mapper with spliced
+    transcripts in both directions.
+    """
+    testMapper = TranscriptMapper()
+    testMapper.import_transcripts(exampleTranscriptFile)
+    for info in [("TR4", "CHR1", 5, "4M10N3M2I5M20N6M", "+"),
+                 ("TR5", "CHR1", 60, "5M10N3M1D5M20N6M", "-"),
+                 ("TR6", "CHR2", 12, "2=1X5N3M", "+")]:
+        testMapper.transcripts[info[0]] = Transcript(*info)
+    return testMapper
+
+
+def per_base_coverage(testMapper, weights=None):
+    """
+    Reference coverage from translating every transcript position
+    """
+    coverage = Counter()
+    for transcript in testMapper.get_transcripts().values():
+        weight = 1 if weights is None else weights.get(transcript.name, 0)
+        for i in range(0, transcript.transcriptEnd + 1):
+            refPos = transcript.translate_coordinates(i)['refPos']
+            if isinstance(refPos, int):
+                coverage[(transcript.chrom, refPos)] += weight
+    return coverage
+
+
+def expand_coverage(results):
+    coverage = Counter()
+    for result in results:
+        for start, end, value in zip(result['starts'].tolist(),
+                                     result['ends'].tolist(),
+                                     result['coverage'].tolist()):
+            for i in range(start, end):
+                coverage[(result['chrom'], i)] += value
+    return coverage
+
+
+"""
+Testing starts here
+"""
+
+
+def test_sum_intervals():
+
+    starts, ends, values = sum_intervals(np.array([0, 5, 5, 20]),
+                                         np.array([10, 10, 8, 25]),
+                                         np.array([1, 1, 2, 1]))
+
+    assert starts.tolist() == [0, 5, 8, 20]
+    assert ends.tolist() == [5, 8, 10, 25]
+    assert values.tolist() == [1, 4, 2, 1]
+
+    # adjacent blocks do not split the coverage
+    starts, ends, values = sum_intervals(np.array([0, 5]), np.array([5, 9]),
+                                         np.array([1, 1]))
+
+    assert list(zip(starts, ends, values)) == [(0, 9, 1)]
+
+
+def test_sum_intervals_float_weights():
+    rng = np.random.RandomState(5)
+    starts = rng.randint(0, 100000, size=6000)
+    ends = starts + rng.randint(1, 200, size=6000)
+    weights = rng.choice([0.1, 0.2, 0.3, 0.7], size=6000)
+
+    intervalStarts, intervalEnds, values = sum_intervals(starts, ends,
+                                                         weights)
+
+    # no negative values or residuals in gaps between the blocks
+    assert np.all(values > 0)
+    counts = np.zeros(100200, dtype=np.int64)
+    np.add.at(counts, starts, 1)
+    np.add.at(counts, ends, -1)
+    counts = np.cumsum(counts)
+    for start, end in zip(intervalStarts, intervalEnds):
+        assert np.all(counts[start:end] > 0)
+
+    # every covered base is reported
+    assert (intervalEnds - intervalStarts).sum() == np.sum(counts > 0)
+
+
+def test_count_junctions():
+
+    starts, ends, counts = count_junctions(np.array([30, 10, 10]),
+                                           np.array([40, 20, 20]),
+                                           np.array([1.0, 0.5, 2.0]))
+
+    assert starts.tolist() == [10, 30]
+    assert ends.tolist() == [20, 40]
+    assert counts.tolist() == [2.5, 1.0]
+
+
+def test_iter_coverage():
+    testMapper = create_mock_mapper()
+
+    results = list(testMapper.iter_coverage())
+
+    assert [x['chrom'] for x in results] == ["CHR1", "CHR2"]
+    assert expand_coverage(results) == +per_base_coverage(testMapper)
+
+    chr1 = results[0]
+    assert list(zip(chr1['junctionStarts'].tolist(),
+                    chr1['junctionEnds'].tolist(),
+                    chr1['junctionCounts'].tolist())) == \
+        [(9, 19, 1), (16, 26, 1), (27, 47, 1), (35, 55, 1)]
+
+    weights = {"TR1": 2.0, "TR4": 0.5, "TR6": 3.0}
+    weightedResults = list(testMapper.iter_coverage(weights=weights))
+
+    assert expand_coverage(weightedResults) == \
+        +per_base_coverage(testMapper, weights)
+    assert weightedResults[1]['junctionCounts'].tolist() == [3.0]
+
+    chr2Results = list(testMapper.iter_coverage(chroms=["CHR2"]))
+    assert [x['chrom'] for x in chr2Results] == ["CHR2"]
+
+
+def test_export_coverage(tmpdir):
+    testMapper = create_mock_mapper()
+    coverageFile = str(tmpdir.join("coverage.bedgraph"))
+    junctionFile = str(tmpdir.join("junctions.tsv"))
+
+    testMapper.export_coverage(coverageFile, junctionFile,
+                               chroms=["CHR2"])
+
+    with open(coverageFile) as f:
+        assert f.readlines() == ["CHR2\t10\t12\t1\n",
+                                 "CHR2\t12\t15\t2\n",
+                                 "CHR2\t15\t20\t1\n",
+                                 "CHR2\t20\t23\t2\n",
+                                 "CHR2\t23\t30\t1\n"]
+
+    with open(junctionFile) as f:
+        assert f.readlines() == ["CHR2\t15\t20\t1\n"]
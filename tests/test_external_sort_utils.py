@@ -0,0 +1,126 @@
+import os
+import random
+import pytest
+from nvta.transcript_utils import Transcript, TranscriptMapper
+from nvta.external_sort_utils import translate_query_file
+
+"""
+Resources for testing
+"""
+
+resourceDir = "./tests/resources"
+
+exampleTranscriptFile = os.path.join(resourceDir,
+                                     "example_transcript_input.tsv")
+
+exampleQueryFile = os.path.join(resourceDir,
+                                "example_query.tsv")
+
+expectedQueryOutput = ["TR1\t4\tCHR1\t7\t+\n",
+                       "TR2\t0\tCHR2\t10\t+\n",
+                       "TR3\t0\tCHR1\t43\t-\n",
+                       "TR1\t13\tCHR1\t23\t+\n",
+                       "TR2\t10\tCHR2\t20\t+\n",
+                       "TR3\t9\tCHR1\t24.1\t-\n"]
+
+
+def create_mock_mapper():
+    testMapper = TranscriptMapper()
+    testMapper.import_transcripts(exampleTranscriptFile)
+    return testMapper
+
+
+def create_random_queries(queryFile, numQueries, seed=0):
+    """
+    Utility function to write a random query file and
+    return the expected translation results.
+    """
+    rng = random.Random(seed)
+    testMapper = create_mock_mapper()
+    transcripts = testMapper.get_transcripts()
+
+    expected = []
+    with open(queryFile, 'w') as f:
+        for i in range(numQueries):
+            name = rng.choice(sorted(transcripts))
+            pos = rng.randint(0, transcripts[name].transcriptEnd)
+            f.write("{}\t{}\n".format(name, pos))
+            expected.append(("{name}\t{inputPos}\t{chrom}\t"
+                             "{refPos}\t{direction}\n").format(
+                **testMapper.run_single_query(name, pos)))
+    return expected
+
+
+"""
+Testing starts here
+"""
+
+
+def test_translate_query_file(tmpdir):
+    testMapper = create_mock_mapper()
+    outputFile = str(tmpdir.join("results.tsv"))
+
+    count = translate_query_file(testMapper, exampleQueryFile, outputFile)
+
+    assert count == 6
+    with open(outputFile) as f:
+        assert f.readlines() == expectedQueryOutput
+
+    count = translate_query_file(testMapper.freeze(), exampleQueryFile,
+                                 outputFile, grouped=True)
+
+    with open(outputFile) as f:
+        assert f.readlines() == [expectedQueryOutput[i]
+                                 for i in [0, 3, 1, 4, 2, 5]]
+
+    with pytest.raises(FileNotFoundError):
+        translate_query_file(testMapper, "./non_existing_file.tsv",
+                             outputFile)
+
+
+def test_translate_query_file_multiple_runs(tmpdir):
+    queryFile = str(tmpdir.join("queries.tsv"))
+    outputFile = str(tmpdir.join("results.tsv"))
+    spillDir = tmpdir.mkdir("spill")
+    expected = create_random_queries(queryFile, 2000)
+
+    # small budget and fan in force many runs and several merge passes
+    count = translate_query_file(create_mock_mapper(), queryFile, outputFile,
+                                 spillDir=str(spillDir), memoryBudget=20000,
+                                 fanIn=3)
+
+    assert count == 2000
+    with open(outputFile) as f:
+        assert f.readlines() == expected
+
+    # spill files are removed
+    assert spillDir.listdir() == []
+
+    translate_query_file(create_mock_mapper(), queryFile, outputFile,
+                         memoryBudget=20000, fanIn=3, grouped=True)
+
+    with open(outputFile) as f:
+        result = f.readlines()
+
+    # grouped by transcript, query order within a transcript
+    assert result == sorted(expected, key=lambda x: x.split("\t")[0])
+
+
+def test_run_queries_out_of_core(tmpdir):
+    testMapper = create_mock_mapper()
+    testMapper.transcripts["TR4"] = Transcript("TR4", "CHR3", 5, "5M3I5M")
+
+    queryFile = tmpdir.join("queries.tsv")
+    queryFile.write("TR4\t6\nTR1\t4\n")
+    outputFile = str(tmpdir.join("results.tsv"))
+
+    assert testMapper.run_queries_out_of_core(str(queryFile),
+                                              outputFile) == 2
+
+    with open(outputFile) as f:
+        assert f.readlines() == ["TR4\t6\tCHR3\t9.2\t+\n",
+                                 "TR1\t4\tCHR1\t7\t+\n"]
+
+    queryFile.write("TR9\t4\n")
+    with pytest.raises(ValueError):
+        testMapper.run_queries_out_of_core(str(queryFile), outputFile)
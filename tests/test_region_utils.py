@@ -0,0 +1,147 @@
+import os
+import gzip
+import random
+import pytest
+from nvta.transcript_utils import TranscriptMapper
+from nvta.cigar_utils import reference_spans
+from nvta.region_utils import (build_region_file, read_region_index,
+                               get_index_file, parse_region,
+                               get_transcript_info_from_regions)
+
+"""
+Resources for testing
+"""
+
+resourceDir = "./tests/resources"
+
+exampleTranscriptFile = os.path.join(resourceDir,
+                                     "example_transcript_input.tsv")
+
+
+def write_random_transcripts(transcriptFile, numTranscripts=300, seed=7):
+    """
+    Utility function to write a transcript file with random
+    transcripts on a few chromosomes, in random order.
+    """
+    rng = random.Random(seed)
+    with open(transcriptFile, 'w') as f:
+        for i in range(numTranscripts):
+            cigar = "".join("{}{}".format(rng.randint(1, 50), op) for op in
+                            rng.choice(["M", "MNM", "MIMDM", "MNMNM"]))
+            f.write("TR{}\tCHR{}\t{}\t{}\t{}\n".format(
+                i, rng.randint(1, 3), rng.randint(200, 5000), cigar,
+                rng.choice("+-")))
+
+
+"""
+Testing starts here
+"""
+
+
+def test_parse_region():
+    assert parse_region("CHR1") == ("CHR1", None, None)
+    assert parse_region("CHR1:100-200") == ("CHR1", 100, 200)
+    assert parse_region("CHR1:1,000-2,000") == ("CHR1", 1000, 2000)
+    assert parse_region(("CHR1", 5, 10)) == ("CHR1", 5, 10)
+
+    with pytest.raises(ValueError):
+        parse_region("CHR1:100")
+    with pytest.raises(ValueError):
+        parse_region("CHR1:200-100")
+
+
+def test_build_region_file(tmpdir):
+    regionFile = str(tmpdir.join("transcripts.tsv.gz"))
+
+    # a block size of one byte puts every transcript in its own block
+    assert build_region_file(exampleTranscriptFile, regionFile,
+                             blockSize=1) == 3
+
+    index = read_region_index(get_index_file(regionFile))
+    assert sorted(index) == ["CHR1", "CHR2"]
+    assert [x[:2] for x in index["CHR1"]] == [(3, 44), (3, 44)]
+    assert [x[:2] for x in index["CHR2"]] == [(10, 30)]
+
+    # blocks form a regular gzip file, sorted by position
+    with gzip.open(regionFile, 'rt') as f:
+        assert [x.split("\t")[0] for x in f] == ["TR1", "TR3", "TR2"]
+
+    # with the default block size transcripts share blocks
+    # unless they are on different chromosomes
+    assert build_region_file(exampleTranscriptFile, regionFile) == 2
+
+    with pytest.raises(ValueError):
+        build_region_file(exampleTranscriptFile, regionFile, blockSize=0)
+
+    # duplicated names keep the last transcript of the file
+    transcriptFile = tmpdir.join("duplicates.tsv")
+    transcriptFile.write("TR1\tCHR1\t3\t8M\t+\n"
+                         "TR2\tCHR1\t10\t20M\t+\n"
+                         "TR1\tCHR1\t50\t5M\t+\n")
+    build_region_file(str(transcriptFile), regionFile)
+    info = get_transcript_info_from_regions(regionFile, ["CHR1"])
+    assert [(x['name'], x['startPos']) for x in info] == \
+        [("TR2", 10), ("TR1", 50)]
+
+
+def test_get_transcript_info_from_regions(tmpdir):
+    regionFile = str(tmpdir.join("transcripts.tsv.gz"))
+    build_region_file(exampleTranscriptFile, regionFile)
+
+    def names(regions):
+        return sorted(x['name'] for x in
+                      get_transcript_info_from_regions(regionFile, regions))
+
+    assert names(["CHR1"]) == ["TR1", "TR3"]
+    assert names(["CHR1:0-3", "CHR2:30-40"]) == []
+    assert names(["CHR1:43-50", "CHR2:0-11"]) == ["TR1", "TR2", "TR3"]
+    assert names(["CHR3"]) == []
+
+    with pytest.raises(FileNotFoundError):
+        get_transcript_info_from_regions(str(tmpdir.join("missing")),
+                                         ["CHR1"])
+
+
+def test_get_transcript_info_from_regions_blocks(tmpdir):
+    transcriptFile = str(tmpdir.join("random.tsv"))
+    regionFile = str(tmpdir.join("random.tsv.gz"))
+    write_random_transcripts(transcriptFile)
+    assert build_region_file(transcriptFile, regionFile, blockSize=512) > 10
+
+    info = TranscriptMapper.get_transcript_info_from_file(transcriptFile)
+    lefts, rights = reference_spans([x['startPos'] for x in info],
+                                    [x['cigar'] for x in info],
+                                    [x['direction'] for x in info])
+
+    rng = random.Random(3)
+    for i in range(50):
+        chrom = "CHR{}".format(rng.randint(1, 3))
+        start = rng.randint(0, 5200)
+        end = start + rng.randint(1, 300)
+
+        expected = sorted(x['name'] for x, left, right in
+                          zip(info, lefts, rights)
+                          if x['chrom'] == chrom and left < end and
+                          right > start)
+        result = get_transcript_info_from_regions(regionFile,
+                                                  [(chrom, start, end)])
+        assert sorted(x['name'] for x in result) == expected
+
+
+def test_import_transcript_regions(tmpdir):
+    regionFile = str(tmpdir.join("transcripts.tsv.gz"))
+    build_region_file(exampleTranscriptFile, regionFile)
+
+    fullMapper = TranscriptMapper()
+    fullMapper.import_transcripts(exampleTranscriptFile)
+
+    for bulk in [False, True]:
+        testMapper = TranscriptMapper()
+        testMapper.import_transcript_regions(regionFile, ["CHR1:20-25"],
+                                             bulk=bulk)
+        assert sorted(testMapper.get_transcripts()) == ["TR1", "TR3"]
+
+        for name in ["TR1", "TR3"]:
+            for i in range(0, 25):
+                assert testMapper.run_single_query(name, i) == \
+                    fullMapper.run_single_query(name, i)
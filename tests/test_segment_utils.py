@@ -0,0 +1,172 @@
+import os
+import mmap
+import pytest
+import numpy as np
+from nvta.transcript_utils import Transcript, TranscriptMapper
+from nvta.segment_utils import SegmentStore
+
+"""
+Resources for testing
+"""
+
+resourceDir = "./tests/resources"
+
+exampleTranscriptFile = os.path.join(resourceDir,
+                                     "example_transcript_input.tsv")
+
+exampleQueryFile = os.path.join(resourceDir,
+                                "example_query.tsv")
+
+
+def create_mock_mapper():
+    """
+    Utility function to create a mapper with transcripts
+    of both directions on several chromosomes.
+    """
+    testMapper = TranscriptMapper()
+    testMapper.import_transcripts(exampleTranscriptFile)
+    testMapper.transcripts["TR4"] = Transcript("TR4", "CHR3", 5,
+                                               "2M3D2I4M7D1M2I7M11D7M", "+")
+    testMapper.transcripts["TR5"] = Transcript("TR5", "CHR3", 46,
+                                               "2M3D2I4M7D1M2I7M11D7M", "-")
+    return testMapper
+
+
+def is_memory_mapped(array):
+    """
+    Utility function to check whether an array is backed by a memory map
+    """
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+    return False
+
+
+"""
+Testing starts here
+"""
+
+
+def test_build_segment_store():
+    testMapper = create_mock_mapper()
+    store = testMapper.build_segment_store()
+
+    assert len(store) == 5
+    assert store.names.tolist() == ["TR1", "TR2", "TR3", "TR4", "TR5"]
+    assert store.chromNames.tolist() == ["CHR1", "CHR2", "CHR3"]
+    assert store.chromIds.tolist() == [0, 1, 0, 2, 2]
+    assert store.strands.tolist() == [1, 1, -1, 1, -1]
+    assert store.offsets.tolist() == [0, 6, 7, 13, 22, 31]
+    assert store.transcriptEnds.tolist() == [24, 19, 24, 24, 24]
+
+    for i, name in enumerate(store.names.tolist()):
+        transcript = testMapper.get_transcripts(name)
+        segStarts, segEnds, segAdjustments = store.get_segments(i)
+        intervals = sorted(transcript.conversionTree)
+
+        assert store.get_info(i) == transcript.get_info()
+        assert segStarts.tolist() == [x.begin for x in intervals]
+        assert segEnds.tolist() == [x.end for x in intervals]
+        assert segAdjustments.tolist() == [x.data for x in intervals]
+
+    # frozen mappers give the same store
+    frozenStore = SegmentStore.from_mapper(testMapper.freeze())
+    assert np.array_equal(frozenStore.segKeys, store.segKeys)
+
+    with pytest.raises(ValueError):
+        store.segStarts[0] = 1
+
+
+def test_translate_batch_long_insertions():
+    testMapper = TranscriptMapper.from_arrays(
+        names=["TR1", "TR2", "TR3"], chroms=["CHR1", "CHR1", "CHR2"],
+        starts=[360, 380, 1000], cigars=["4M15I6M", "4M15I3N6M", "3M12I2D4M"],
+        strands=["+", "-", "+"])
+    store = testMapper.build_segment_store()
+
+    for i, name in enumerate(store.names.tolist()):
+        transcript = testMapper.get_transcripts(name)
+        positions = np.arange(0, transcript.transcriptEnd + 1)
+        refPositions = store.translate_batch(np.full(len(positions), i),
+                                             positions)
+
+        assert refPositions.tolist() == \
+            [transcript.translate_coordinates(x)['refPos']
+             for x in positions.tolist()]
+
+
+def test_translate_batch():
+    testMapper = create_mock_mapper()
+    store = testMapper.build_segment_store()
+
+    names = []
+    positions = []
+    expected = []
+    for name, transcript in testMapper.get_transcripts().items():
+        for i in range(0, transcript.transcriptEnd + 1):
+            result = transcript.translate_coordinates(i)
+            names.append(name)
+            positions.append(i)
+            expected.append((result['chrom'], result['refPos']))
+
+    # shuffle to get a mixed batch
+    order = np.random.default_rng(0).permutation(len(names))
+    names = [names[i] for i in order]
+    positions = [positions[i] for i in order]
+    expected = [expected[i] for i in order]
+
+    chroms, refPositions = store.translate_names(names, positions)
+
+    assert list(zip(chroms.tolist(), refPositions.tolist())) == expected
+
+    with pytest.raises(ValueError):
+        store.translate_names(["TR9"], [0])
+
+    with pytest.raises(ValueError):
+        store.translate_names(["TR2"], [20])
+
+    with pytest.raises(ValueError):
+        store.translate_batch([5], [0])
+
+
+def test_save_load(tmpdir):
+    store = create_mock_mapper().build_segment_store()
+    storeDir = str(tmpdir.join("store"))
+    store.save(storeDir)
+
+    for useMmap in [True, False]:
+        loaded = SegmentStore.load(storeDir, mmap=useMmap)
+
+        for field in SegmentStore.storedFields + SegmentStore.derivedFields:
+            assert np.array_equal(getattr(loaded, field),
+                                  getattr(store, field))
+            # derived arrays are memory mapped as well
+            assert is_memory_mapped(getattr(loaded, field)) == useMmap
+
+        queries = TranscriptMapper.get_query_from_file(exampleQueryFile)
+        names = [x['name'] for x in queries]
+        positions = [x['queryPos'] for x in queries]
+
+        assert np.array_equal(loaded.translate_names(names, positions)[1],
+                              store.translate_names(names, positions)[1])
+
+    # stores of other format versions are rejected
+    with open(os.path.join(storeDir, "format.txt"), 'w') as f:
+        f.write("nvta segment store\t0\n")
+    with pytest.raises(ValueError):
+        SegmentStore.load(storeDir)
+
+    os.remove(os.path.join(storeDir, "format.txt"))
+    with pytest.raises(ValueError):
+        SegmentStore.load(storeDir)
+
+    with pytest.raises(FileNotFoundError):
+        SegmentStore.load(str(tmpdir.join("non_existing")))
+
+
+def test_empty_store():
+    store = TranscriptMapper().build_segment_store()
+
+    assert len(store) == 0
+    assert store.translate_batch([], []).tolist() == []
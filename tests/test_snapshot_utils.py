@@ -0,0 +1,120 @@
+import os
+import pytest
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from nvta.transcript_utils import Transcript, TranscriptMapper
+from nvta.snapshot_utils import FrozenTranscript
+
+"""
+Resources for testing
+"""
+
+resourceDir = "./tests/resources"
+
+exampleTranscriptFile = os.path.join(resourceDir,
+                                     "example_transcript_input.tsv")
+
+exampleQueryFile = os.path.join(resourceDir,
+                                "example_query.tsv")
+
+
+def create_frozen_mapper():
+    testMapper = TranscriptMapper()
+    testMapper.import_transcripts(exampleTranscriptFile)
+    return testMapper, testMapper.freeze()
+
+
+"""
+Testing starts here
+"""
+
+
+def test_frozen_transcript_matches_transcript():
+
+    for cigar, startPos, direction in [("8M7D6M2I2M11D7M", 3, "+"),
+                                       ("8M7D6M2I2M11D7M", 43, "-"),
+                                       ("2M3D2I4M7D1M2I7M11D7M", 5, "+"),
+                                       ("2M3D2I4M7D1M2I7M11D7M", 46, "-"),
+                                       # insertions of 10 or more bases
+                                       ("4M15I6M", 360, "+"),
+                                       ("4M15I3N6M", 380, "-"),
+                                       ("3M12I2D4M", 1000, "+")]:
+        transcript = Transcript("TR1", "CHR1", startPos, cigar, direction)
+        frozen = FrozenTranscript.from_transcript(transcript)
+
+        assert frozen.transcriptEnd == transcript.transcriptEnd
+        assert frozen.get_info() == transcript.get_info()
+
+        positions = np.arange(0, transcript.transcriptEnd + 1)
+        batch = frozen.translate_batch(positions)
+
+        for i in positions.tolist():
+            expected = transcript.translate_coordinates(i)
+            assert frozen.translate_coordinates(i) == expected
+            assert batch[i] == expected['refPos']
+
+        with pytest.raises(ValueError):
+            frozen.translate_coordinates(-1)
+
+        with pytest.raises(ValueError):
+            frozen.translate_batch([0, transcript.transcriptEnd + 1])
+
+
+def test_frozen_is_read_only():
+    testMapper, frozenMapper = create_frozen_mapper()
+    frozen = frozenMapper.get_transcripts("TR1")
+
+    with pytest.raises(AttributeError):
+        frozen.startPos = 10
+
+    with pytest.raises(AttributeError):
+        frozenMapper.transcripts = {}
+
+    with pytest.raises(TypeError):
+        frozenMapper.transcripts["TR9"] = frozen
+
+    with pytest.raises(ValueError):
+        frozen.segStarts[0] = 1
+
+    # snapshot is independent of later changes to the mapper
+    testMapper.transcripts = {}
+    assert sorted(frozenMapper.get_transcripts()) == ["TR1", "TR2", "TR3"]
+
+
+def test_frozen_mapper_queries():
+    testMapper, frozenMapper = create_frozen_mapper()
+
+    queries = TranscriptMapper.get_query_from_file(exampleQueryFile)
+    testMapper.import_queries(exampleQueryFile)
+    testMapper.run_all_queries()
+
+    assert frozenMapper.run_queries(queries) == \
+        testMapper.get_query_results()
+
+    names = [x['name'] for x in queries]
+    positions = [x['queryPos'] for x in queries]
+    expected = [x['refPos'] for x in testMapper.get_query_results()]
+
+    assert frozenMapper.translate_batch(names, positions).tolist() == expected
+
+    with pytest.raises(ValueError):
+        frozenMapper.run_single_query("TR9", 0)
+
+    with pytest.raises(ValueError):
+        frozenMapper.translate_batch(["TR9"], [0])
+
+
+def test_frozen_mapper_threads():
+    testMapper, frozenMapper = create_frozen_mapper()
+
+    names = np.array(["TR1", "TR2", "TR3"] * 1000)
+    positions = np.tile([4, 10, 9], 1000)
+    expected = frozenMapper.translate_batch(names, positions)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(
+            lambda x: frozenMapper.translate_batch(names, positions),
+            range(16)))
+
+    for result in results:
+        assert np.array_equal(result, expected)
@@ -326,3 +326,128 @@ def test_check_query_line():
     invalidLine2 = "TR1\tU\n"
     with pytest.raises(Exception):
         TranscriptMapper.check_query_line(invalidLine2)
+
+
+def test_reverse_translate_coordinates():
+
+    testPos = create_mock_transcript(cigar="8M7D6M2I2M11D7M",
+                                     direction="+")
+
+    expectedPos = {'name': 'TR1', 'refPos': 7, 'chrom': 'CHR1',
+                   'transcriptPos': 4, 'direction': "+"}
+
+    assert testPos.reverse_translate_coordinates(7) == expectedPos
+    assert testPos.reverse_translate_coordinates(24)['transcriptPos'] == 16
+
+    testNeg = create_mock_transcript(name="TR3",
+                                     startPos=43,
+                                     cigar="8M7D6M2I2M11D7M",
+                                     direction="-")
+
+    assert testNeg.reverse_translate_coordinates(43)['transcriptPos'] == 0
+    assert testNeg.reverse_translate_coordinates(3)['transcriptPos'] == 24
+
+    # every aligned position translates back to where it came from
+    for testTranscript in [testPos, testNeg]:
+        for i in range(0, testTranscript.transcriptEnd + 1):
+            refPos = testTranscript.translate_coordinates(i)['refPos']
+            if isinstance(refPos, int):
+                result = testTranscript.reverse_translate_coordinates(refPos)
+                assert result['transcriptPos'] == i
+
+    # deletion and out of bounds positions are not aligned
+    with pytest.raises(ValueError):
+        testPos.reverse_translate_coordinates(12)
+
+    with pytest.raises(ValueError):
+        testPos.reverse_translate_coordinates(2)
+
+
+def test_run_reverse_query():
+    testMapper = TranscriptMapper()
+    testMapper.import_transcripts(exampleTranscriptFile)
+
+    result = testMapper.run_reverse_query("CHR1", 7)
+
+    assert sorted((x['name'], x['transcriptPos']) for x in result) == \
+        [('TR1', 4), ('TR3', 20)]
+
+    assert testMapper.run_reverse_query("CHR2", 7) == []
+    assert testMapper.run_reverse_query("CHR9", 7) == []
+
+    # the index follows newly imported and added transcripts
+    testMapper.transcripts["TR4"] = Transcript("TR4", "CHR2", 5, "4M", "+")
+    assert [x['name'] for x in testMapper.run_reverse_query("CHR2", 7)] == \
+        ["TR4"]
+
+    # replacing a transcript in place updates the index
+    testMapper.transcripts["TR1"] = Transcript("TR1", "CHR1", 100, "5M", "+")
+    assert [(x['name'], x['transcriptPos']) for x in
+            testMapper.run_reverse_query("CHR1", 101)] == [("TR1", 1)]
+    assert [x['name'] for x in testMapper.run_reverse_query("CHR1", 7)] == \
+        ["TR3"]
+
+    del testMapper.transcripts["TR3"]
+    assert testMapper.run_reverse_query("CHR1", 7) == []
+
+    # as does replacing all transcripts with a dict of the same size
+    testMapper.transcripts = {"TR5": Transcript("TR5", "CHR1", 3, "5M", "+"),
+                              "TR6": Transcript("TR6", "CHR2", 0, "5M", "+"),
+                              "TR7": Transcript("TR7", "CHR2", 9, "5M", "+")}
+    assert [x['name'] for x in testMapper.run_reverse_query("CHR1", 7)] == \
+        ["TR5"]
+
+
+def test_run_reverse_query_bulk():
+    testMapper = TranscriptMapper.from_arrays(
+        names=["TR1", "TR2", "TR3", "TR4"],
+        chroms=["CHR1", "CHR1", "CHR1", "CHR2"],
+        starts=[3, 43, 20, 10],
+        cigars=["8M7D6M2I2M11D7M", "8M7D6M2I2M11D7M", "3M12I5N4M", "20M"],
+        strands=["+", "-", "-", "+"])
+
+    expected = {}
+    for transcript in testMapper.get_transcripts().values():
+        for i in range(0, transcript.transcriptEnd + 1):
+            refPos = transcript.translate_coordinates(i)['refPos']
+            if isinstance(refPos, int):
+                expected.setdefault((transcript.chrom, refPos), []).append(
+                    (transcript.name, i))
+
+    for chrom in ["CHR1", "CHR2"]:
+        for refPos in range(0, 60):
+            result = testMapper.run_reverse_query(chrom, refPos)
+            assert [(x['name'], x['transcriptPos']) for x in result] == \
+                expected.get((chrom, refPos), [])
+
+    # reverse queries do not build the IntervalTrees of bulk transcripts
+    assert all(x._conversionTree is None
+               for x in testMapper.get_transcripts().values())
+
+
+def test_export_import_index(tmpdir):
+    testMapper = TranscriptMapper()
+    testMapper.import_transcripts(exampleTranscriptFile)
+
+    indexFile = str(tmpdir.join("transcripts.idx"))
+    testMapper.export_index(indexFile)
+
+    indexMapper = TranscriptMapper()
+    indexMapper.import_index(indexFile)
+
+    assert sorted(indexMapper.get_transcripts()) == ["TR1", "TR2", "TR3"]
+    for name, transcript in testMapper.get_transcripts().items():
+        for i in range(0, transcript.transcriptEnd + 1):
+            assert indexMapper.run_single_query(name, i) == \
+                testMapper.run_single_query(name, i)
+    assert indexMapper.run_reverse_query("CHR1", 7) == \
+        testMapper.run_reverse_query("CHR1", 7)
+
+    with pytest.raises(FileNotFoundError):
+        indexMapper.import_index("./non_existing_file.idx")
+
+    # files that are not an index of this version are rejected
+    oldIndex = tmpdir.join("old.idx")
+    oldIndex.write_binary(b"\x80\x05not an index")
+    with pytest.raises(ValueError):
+        indexMapper.import_index(str(oldIndex))